@@ -1,24 +1,207 @@
 """SQLite database setup and models for Lucernex Plumbing Dashboard."""
 
+import atexit
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, Sequence
 
 DB_PATH = Path(__file__).parent.parent / "dashboard.db"
+# Connect strings, rendered once rather than on every connection open.
+_DB_PATH_STR = str(DB_PATH)
+_DB_URI = DB_PATH.as_uri()
 
+# Connection-scoped tuning applied to every handle we open: fewer fsyncs
+# (safe under WAL), in-memory temp tables, a 64 MB page cache, 256 MB mmap,
+# a busy wait instead of an immediate SQLITE_BUSY, and a 64 MB cap on the
+# -wal file left behind after a checkpoint.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA wal_autocheckpoint=1000",
+    "PRAGMA journal_size_limit=67108864",
+)
 
-def get_db() -> sqlite3.Connection:
-    """Get a database connection with row factory."""
-    conn = sqlite3.connect(str(DB_PATH))
+
+def _configure(conn: sqlite3.Connection) -> None:
+    """Apply the row factory and per-connection pragmas to a new handle."""
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    atexit.register(conn.close)
+
+
+# Compiled statements are cached per connection keyed by the exact SQL
+# text, so keep query strings constant and vary only the parameters.
+_STATEMENT_CACHE_SIZE = 256
+
+
+# One connection per thread, opened and configured on first use and reused
+# for the life of the process (closed at exit). Callers must not close it.
+_tls = threading.local()
+
+
+def get_db() -> sqlite3.Connection:
+    """Return this thread's cached database connection (row factory set)."""
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(
+            _DB_PATH_STR, check_same_thread=False,
+            cached_statements=_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA foreign_keys=ON")
+        _configure(conn)
+        _tls.conn = conn
     return conn
 
 
-def init_db() -> None:
-    """Create tables if they don't exist."""
-    conn = get_db()
-    conn.executescript("""
+# ── Reader pool / single writer ──────────────────────────────────────
+# WAL lets any number of readers run alongside one writer, so all mutations
+# share a single writer connection (serialised by _writer_lock, explicit
+# BEGIN IMMEDIATE) while reads borrow from a pool of read-only handles.
+
+# Bounded: beyond a handful of readers the GIL, not SQLite, is the limit.
+_READER_POOL_SIZE = min(os.cpu_count() or 4, 8)
+
+# Opt-in for single-process runs (e.g. a standalone ETL): the writer keeps
+# the file lock for its lifetime instead of taking and releasing it on
+# every transaction.  This locks out every other connection, including
+# get_db() and the reader pool, so leave it off for the web app.
+_EXCLUSIVE_LOCK = os.environ.get("LUCERNEX_EXCLUSIVE_LOCK") == "1"
+
+_writer: sqlite3.Connection | None = None
+_writer_lock = threading.RLock()
+_reader_pool: queue.Queue | None = None
+_reader_pool_lock = threading.Lock()
+
+
+def get_writer() -> sqlite3.Connection:
+    """Return the shared autocommit writer connection, opening it once.
+
+    Use ``write_txn()`` rather than issuing statements on it directly so
+    concurrent writers are serialised.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            conn = sqlite3.connect(
+                f"{_DB_URI}?mode=rwc", uri=True,
+                isolation_level=None, check_same_thread=False,
+                cached_statements=_STATEMENT_CACHE_SIZE,
+            )
+            conn.execute("PRAGMA foreign_keys=ON")
+            _configure(conn)
+            if _EXCLUSIVE_LOCK:
+                conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+                # The lock is only taken on the next write; grab it now.
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("COMMIT")
+            _writer = conn
+        return _writer
+
+
+@contextmanager
+def write_txn() -> Iterator[sqlite3.Connection]:
+    """Run the enclosed statements as one BEGIN IMMEDIATE transaction."""
+    with _writer_lock:
+        conn = get_writer()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def get_reader() -> sqlite3.Connection:
+    """Borrow a read-only connection; hand it back with ``release_reader``."""
+    global _reader_pool
+    with _reader_pool_lock:
+        if _reader_pool is None:
+            pool: queue.Queue = queue.Queue(maxsize=_READER_POOL_SIZE)
+            for _ in range(_READER_POOL_SIZE):
+                conn = sqlite3.connect(
+                    f"{_DB_URI}?mode=ro", uri=True,
+                    check_same_thread=False,
+                    cached_statements=_STATEMENT_CACHE_SIZE,
+                )
+                _configure(conn)
+                pool.put(conn)
+            _reader_pool = pool
+    return _reader_pool.get()
+
+
+def release_reader(conn: sqlite3.Connection) -> None:
+    """Return a connection obtained from ``get_reader`` to the pool."""
+    _reader_pool.put(conn)
+
+
+@contextmanager
+def db_txn() -> Iterator[sqlite3.Connection]:
+    """Scope a pooled read-only connection to a ``with`` block.
+
+    The reader is handed back on exit, never closed, so its statement
+    cache stays warm.  Writes go through ``write_txn()``.
+    """
+    conn = get_reader()
+    try:
+        yield conn
+    finally:
+        release_reader(conn)
+
+
+def fetch_dicts(
+    conn: sqlite3.Connection, sql: str, params: Sequence = (),
+) -> list[dict]:
+    """Run ``sql`` and return its rows as plain dicts.
+
+    Steps a tuple cursor and zips each row with the column names read
+    once from ``description``: about twice as fast as ``dict(Row)``.
+    """
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, row)) for row in cur]
+
+
+# A dedicated read-only handle for PRAGMA data_version.  It never writes, so
+# its counter moves whenever any other connection commits, whether from this
+# process or another one (e.g. a command-line ETL run).
+_version_conn: sqlite3.Connection | None = None
+_version_lock = threading.Lock()
+
+
+def data_version() -> int:
+    """Return a counter that changes after every commit to the database.
+
+    Cheap enough to call per request; use it in cache keys so cached
+    results are dropped as soon as the data underneath them changes.
+    """
+    global _version_conn
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = sqlite3.connect(
+                f"{_DB_URI}?mode=ro", uri=True, check_same_thread=False,
+            )
+            atexit.register(_version_conn.close)
+        return _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+# Schema migrations, applied in order by init_db().  PRAGMA user_version
+# records how many have run, so a current database costs one integer read
+# at startup.  Append new steps; never edit one that has shipped.
+_MIGRATIONS: list[str] = [
+    # 1: baseline schema.  IF NOT EXISTS lets databases created before
+    # versioning (user_version 0) adopt it in place.
+    """
         CREATE TABLE IF NOT EXISTS projects (
             project_id TEXT PRIMARY KEY,
             project_type TEXT NOT NULL,
@@ -40,6 +223,11 @@ def init_db() -> None:
             lucernex_updated_at TEXT
         );
 
+        CREATE INDEX IF NOT EXISTS idx_projects_sap
+            ON projects(sap_project_definition);
+        CREATE INDEX IF NOT EXISTS idx_projects_store
+            ON projects(store, project_status);
+
         CREATE TABLE IF NOT EXISTS sap_budget (
             sap_project_definition TEXT PRIMARY KEY,
             budget_total REAL,
@@ -62,6 +250,9 @@ def init_db() -> None:
             last_update TEXT
         );
 
+        CREATE INDEX IF NOT EXISTS idx_sap_po_proj
+            ON sap_po(sap_project_definition, po_status);
+
         CREATE TABLE IF NOT EXISTS lucernex_documents (
             doc_id TEXT PRIMARY KEY,
             project_id TEXT NOT NULL,
@@ -78,11 +269,6 @@ def init_db() -> None:
             is_deleted INTEGER DEFAULT 0
         );
 
-        CREATE INDEX IF NOT EXISTS idx_lxdocs_project
-            ON lucernex_documents(project_id);
-        CREATE INDEX IF NOT EXISTS idx_lxdocs_folder
-            ON lucernex_documents(folder_category, sub_folder);
-
         -- SAP WBS node-level budget data (program positions), per fiscal year.
         CREATE TABLE IF NOT EXISTS sap_wbs_nodes (
             node_key TEXT NOT NULL,
@@ -104,6 +290,9 @@ def init_db() -> None:
             PRIMARY KEY (node_key, approval_year)
         );
 
+        CREATE INDEX IF NOT EXISTS idx_wbs_year
+            ON sap_wbs_nodes(approval_year, node_key);
+
         -- Tracks when each BQ source was last updated and when we last pulled.
         CREATE TABLE IF NOT EXISTS refresh_metadata (
             source_key TEXT PRIMARY KEY,
@@ -111,17 +300,378 @@ def init_db() -> None:
             source_last_updated TEXT,
             dashboard_refreshed_at TEXT
         );
-    """)
-    conn.commit()
-    conn.close()
+
+        -- Full-table predecessors of the partial document indexes below.
+        DROP INDEX IF EXISTS idx_lxdocs_project;
+        DROP INDEX IF EXISTS idx_lxdocs_folder;
+
+        -- Every document read filters on is_deleted = 0, so soft-deleted
+        -- rows are left out of the index entirely.
+        CREATE INDEX IF NOT EXISTS idx_lxdocs_project_live
+            ON lucernex_documents(project_id) WHERE is_deleted = 0;
+        CREATE INDEX IF NOT EXISTS idx_lxdocs_folder_live
+            ON lucernex_documents(folder_category, sub_folder)
+            WHERE is_deleted = 0;
+    """,
+    # 2: PK-lookup tables become WITHOUT ROWID, so each row lives once in
+    # the primary-key B-tree instead of a rowid table plus a PK index.
+    # projects and lucernex_documents keep rowids (wide rows).
+    """
+        CREATE TABLE sap_budget_new (
+            sap_project_definition TEXT PRIMARY KEY,
+            budget_total REAL,
+            budget_open REAL,
+            budget_committed REAL,
+            budget_actuals REAL,
+            sap_updated_at TEXT
+        ) WITHOUT ROWID;
+        INSERT INTO sap_budget_new SELECT * FROM sap_budget
+            WHERE sap_project_definition IS NOT NULL;
+        DROP TABLE sap_budget;
+        ALTER TABLE sap_budget_new RENAME TO sap_budget;
+
+        CREATE TABLE sap_po_new (
+            po_number TEXT PRIMARY KEY,
+            sap_project_definition TEXT,
+            vendor TEXT,
+            vendor_email TEXT,
+            po_total REAL,
+            invoiced_to_date REAL,
+            remaining_to_invoice REAL,
+            po_status TEXT,
+            created_date TEXT,
+            last_update TEXT
+        ) WITHOUT ROWID;
+        INSERT INTO sap_po_new SELECT * FROM sap_po
+            WHERE po_number IS NOT NULL;
+        DROP TABLE sap_po;
+        ALTER TABLE sap_po_new RENAME TO sap_po;
+        CREATE INDEX idx_sap_po_proj
+            ON sap_po(sap_project_definition, po_status);
+
+        CREATE TABLE sap_wbs_nodes_new (
+            node_key TEXT NOT NULL,
+            approval_year INTEGER NOT NULL,
+            node_label TEXT,
+            description TEXT,
+            original_budget REAL DEFAULT 0,
+            supplemental_budget REAL DEFAULT 0,
+            returned_budget REAL DEFAULT 0,
+            current_budget REAL DEFAULT 0,
+            actuals REAL DEFAULT 0,
+            open_commitments REAL DEFAULT 0,
+            budget_available REAL DEFAULT 0,
+            distributed_budget REAL DEFAULT 0,
+            budget_cf_from_prev REAL DEFAULT 0,
+            budget_cf_to_next REAL DEFAULT 0,
+            project_count INTEGER DEFAULT 0,
+            last_updated TEXT,
+            PRIMARY KEY (node_key, approval_year)
+        ) WITHOUT ROWID;
+        INSERT INTO sap_wbs_nodes_new SELECT * FROM sap_wbs_nodes;
+        DROP TABLE sap_wbs_nodes;
+        ALTER TABLE sap_wbs_nodes_new RENAME TO sap_wbs_nodes;
+        CREATE INDEX idx_wbs_year
+            ON sap_wbs_nodes(approval_year, node_key);
+
+        CREATE TABLE refresh_metadata_new (
+            source_key TEXT PRIMARY KEY,
+            source_label TEXT,
+            source_last_updated TEXT,
+            dashboard_refreshed_at TEXT
+        ) WITHOUT ROWID;
+        INSERT INTO refresh_metadata_new SELECT * FROM refresh_metadata
+            WHERE source_key IS NOT NULL;
+        DROP TABLE refresh_metadata;
+        ALTER TABLE refresh_metadata_new RENAME TO refresh_metadata;
+    """,
+    # 3: is_deleted is a strict 0/1 flag, so the planner can rely on the
+    # partial "is_deleted = 0" indexes.
+    """
+        CREATE TABLE lucernex_documents_new (
+            doc_id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            folder_id TEXT,
+            folder_category TEXT,
+            sub_folder TEXT,
+            doc_name TEXT,
+            doc_url TEXT,
+            doc_type TEXT,
+            doc_size TEXT,
+            uploaded_by TEXT,
+            uploaded_at TEXT,
+            last_checked TEXT,
+            is_deleted INTEGER NOT NULL DEFAULT 0
+                CHECK (is_deleted IN (0, 1))
+        );
+        INSERT INTO lucernex_documents_new
+        SELECT doc_id, project_id, folder_id, folder_category, sub_folder,
+               doc_name, doc_url, doc_type, doc_size, uploaded_by,
+               uploaded_at, last_checked,
+               CASE WHEN is_deleted THEN 1 ELSE 0 END
+        FROM lucernex_documents;
+        DROP TABLE lucernex_documents;
+        ALTER TABLE lucernex_documents_new RENAME TO lucernex_documents;
+        CREATE INDEX idx_lxdocs_project_live
+            ON lucernex_documents(project_id) WHERE is_deleted = 0;
+        CREATE INDEX idx_lxdocs_folder_live
+            ON lucernex_documents(folder_category, sub_folder)
+            WHERE is_deleted = 0;
+    """,
+    # 4: lets the ETL's vendor-per-project ranking read sap_po in group order.
+    """
+        CREATE INDEX IF NOT EXISTS idx_sap_po_proj_vendor
+            ON sap_po(sap_project_definition, vendor);
+    """,
+    # 5: the sync's soft-delete checks every doc_id of one project against
+    # the seen set; (project_id, doc_id) answers that from the index alone.
+    # Active-document reads are already served by idx_lxdocs_project_live.
+    """
+        CREATE INDEX IF NOT EXISTS idx_lxdocs_project_docid
+            ON lucernex_documents(project_id, doc_id);
+    """,
+    # 6: digest of a document's synced fields, so unchanged rows can be
+    # skipped by the upsert (NULL until the next sync rewrites the row).
+    """
+        ALTER TABLE lucernex_documents ADD COLUMN content_hash TEXT;
+    """,
+    # 7: a PO's last-activity day as a Julian day number, so PO aging is a
+    # subtraction and the 30-day filter an index range scan.  VIRTUAL:
+    # ALTER TABLE cannot add STORED columns, and the index stores it anyway.
+    """
+        ALTER TABLE sap_po ADD COLUMN activity_day REAL
+            GENERATED ALWAYS AS
+                (JULIANDAY(COALESCE(last_update, created_date))) VIRTUAL;
+        CREATE INDEX IF NOT EXISTS idx_sap_po_activity_day
+            ON sap_po(activity_day);
+    """,
+    # 8: indexes for the equality filters, filter dropdowns (SELECT
+    # DISTINCT ... ORDER BY) and GROUP BY charts, so they read an index in
+    # order instead of scanning and sorting.  The covering sap_po index
+    # answers the per-project PO sums from the index alone and replaces
+    # idx_sap_po_proj, its prefix.
+    """
+        CREATE INDEX IF NOT EXISTS idx_projects_status
+            ON projects(project_status);
+        CREATE INDEX IF NOT EXISTS idx_projects_type
+            ON projects(project_type);
+        CREATE INDEX IF NOT EXISTS idx_projects_contractor
+            ON projects(general_contractor);
+        CREATE INDEX IF NOT EXISTS idx_projects_banner
+            ON projects(banner);
+        CREATE INDEX IF NOT EXISTS idx_sap_po_vendor
+            ON sap_po(vendor);
+        CREATE INDEX IF NOT EXISTS idx_sap_po_status
+            ON sap_po(po_status);
+        CREATE INDEX IF NOT EXISTS idx_sap_po_proj_totals
+            ON sap_po(sap_project_definition, po_total, invoiced_to_date,
+                      remaining_to_invoice);
+        DROP INDEX IF EXISTS idx_sap_po_proj;
+    """,
+    # 9: per-project PO totals kept current by triggers, so the projects
+    # list joins one row per project instead of aggregating every PO per
+    # request.  The triggers adjust the sums in place (O(1) per PO row, so
+    # the ETL's full reload stays linear); the non-NULL counts keep SUM()'s
+    # semantics of NULL when a project has no values.
+    """
+        CREATE TABLE sap_po_agg (
+            sap_project_definition TEXT PRIMARY KEY,
+            po_count INTEGER NOT NULL,
+            n_po_total INTEGER NOT NULL,
+            total_po REAL,
+            n_invoiced INTEGER NOT NULL,
+            total_invoiced REAL
+        ) WITHOUT ROWID;
+        INSERT INTO sap_po_agg
+        SELECT sap_project_definition, COUNT(*),
+               COUNT(po_total), SUM(po_total),
+               COUNT(invoiced_to_date), SUM(invoiced_to_date)
+        FROM sap_po WHERE sap_project_definition IS NOT NULL
+        GROUP BY sap_project_definition;
+
+        CREATE TRIGGER sap_po_agg_ins AFTER INSERT ON sap_po
+        WHEN new.sap_project_definition IS NOT NULL BEGIN
+            INSERT INTO sap_po_agg
+                (sap_project_definition, po_count, n_po_total, total_po,
+                 n_invoiced, total_invoiced)
+            VALUES (new.sap_project_definition, 1,
+                    new.po_total IS NOT NULL, new.po_total,
+                    new.invoiced_to_date IS NOT NULL, new.invoiced_to_date)
+            ON CONFLICT(sap_project_definition) DO UPDATE SET
+                po_count = po_count + 1,
+                n_po_total = n_po_total + excluded.n_po_total,
+                total_po = CASE WHEN excluded.n_po_total
+                    THEN COALESCE(total_po, 0) + excluded.total_po
+                    ELSE total_po END,
+                n_invoiced = n_invoiced + excluded.n_invoiced,
+                total_invoiced = CASE WHEN excluded.n_invoiced
+                    THEN COALESCE(total_invoiced, 0) + excluded.total_invoiced
+                    ELSE total_invoiced END;
+        END;
+        CREATE TRIGGER sap_po_agg_del AFTER DELETE ON sap_po
+        WHEN old.sap_project_definition IS NOT NULL BEGIN
+            UPDATE sap_po_agg SET
+                po_count = po_count - 1,
+                n_po_total = n_po_total - (old.po_total IS NOT NULL),
+                total_po = CASE
+                    WHEN old.po_total IS NULL THEN total_po
+                    WHEN n_po_total = 1 THEN NULL
+                    ELSE total_po - old.po_total END,
+                n_invoiced = n_invoiced - (old.invoiced_to_date IS NOT NULL),
+                total_invoiced = CASE
+                    WHEN old.invoiced_to_date IS NULL THEN total_invoiced
+                    WHEN n_invoiced = 1 THEN NULL
+                    ELSE total_invoiced - old.invoiced_to_date END
+            WHERE sap_project_definition = old.sap_project_definition;
+            DELETE FROM sap_po_agg
+            WHERE sap_project_definition = old.sap_project_definition
+              AND po_count = 0;
+        END;
+        CREATE TRIGGER sap_po_agg_upd_old
+        AFTER UPDATE OF sap_project_definition, po_total, invoiced_to_date
+        ON sap_po WHEN old.sap_project_definition IS NOT NULL BEGIN
+            UPDATE sap_po_agg SET
+                po_count = po_count - 1,
+                n_po_total = n_po_total - (old.po_total IS NOT NULL),
+                total_po = CASE
+                    WHEN old.po_total IS NULL THEN total_po
+                    WHEN n_po_total = 1 THEN NULL
+                    ELSE total_po - old.po_total END,
+                n_invoiced = n_invoiced - (old.invoiced_to_date IS NOT NULL),
+                total_invoiced = CASE
+                    WHEN old.invoiced_to_date IS NULL THEN total_invoiced
+                    WHEN n_invoiced = 1 THEN NULL
+                    ELSE total_invoiced - old.invoiced_to_date END
+            WHERE sap_project_definition = old.sap_project_definition;
+            DELETE FROM sap_po_agg
+            WHERE sap_project_definition = old.sap_project_definition
+              AND po_count = 0;
+        END;
+        CREATE TRIGGER sap_po_agg_upd_new
+        AFTER UPDATE OF sap_project_definition, po_total, invoiced_to_date
+        ON sap_po WHEN new.sap_project_definition IS NOT NULL BEGIN
+            INSERT INTO sap_po_agg
+                (sap_project_definition, po_count, n_po_total, total_po,
+                 n_invoiced, total_invoiced)
+            VALUES (new.sap_project_definition, 1,
+                    new.po_total IS NOT NULL, new.po_total,
+                    new.invoiced_to_date IS NOT NULL, new.invoiced_to_date)
+            ON CONFLICT(sap_project_definition) DO UPDATE SET
+                po_count = po_count + 1,
+                n_po_total = n_po_total + excluded.n_po_total,
+                total_po = CASE WHEN excluded.n_po_total
+                    THEN COALESCE(total_po, 0) + excluded.total_po
+                    ELSE total_po END,
+                n_invoiced = n_invoiced + excluded.n_invoiced,
+                total_invoiced = CASE WHEN excluded.n_invoiced
+                    THEN COALESCE(total_invoiced, 0) + excluded.total_invoiced
+                    ELSE total_invoiced END;
+        END;
+    """,
+    # 10: the give-back filter tests LOWER(project_status) = 'complete';
+    # an index on the same expression lets it seek the complete projects
+    # instead of lowering every joined row's status.
+    """
+        CREATE INDEX IF NOT EXISTS idx_projects_status_lower
+            ON projects(LOWER(project_status));
+    """,
+    # 11: the dashboard's unfiltered chart aggregates, computed once per
+    # ETL load and served as stored JSON until the next one.
+    """
+        CREATE TABLE dashboard_snapshots (
+            endpoint TEXT PRIMARY KEY,
+            payload_json TEXT NOT NULL,
+            refreshed_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """,
+]
+
+CURRENT_SCHEMA_VERSION = len(_MIGRATIONS)
+
+
+def init_db() -> None:
+    """Bring the schema up to CURRENT_SCHEMA_VERSION."""
+    fresh = not DB_PATH.exists() or DB_PATH.stat().st_size == 0
+    with _writer_lock:
+        conn = get_writer()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= CURRENT_SCHEMA_VERSION:
+            return
+        if fresh:
+            # File-format settings only apply before the first table is
+            # written (and before WAL): 8 KiB pages keep the wide projects
+            # rows shallower, incremental auto-vacuum lets us shrink later.
+            conn.execute("PRAGMA page_size=8192")
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        # WAL is persisted in the file, so only switch (which needs a write
+        # lock) when the database isn't already in WAL mode.
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if mode.lower() != "wal":
+            conn.execute("PRAGMA journal_mode=WAL")
+        # Each step commits together with its version bump, so an
+        # interrupted upgrade resumes from the last completed step.
+        for step in range(version, CURRENT_SCHEMA_VERSION):
+            try:
+                conn.executescript(
+                    f"BEGIN IMMEDIATE;\n{_MIGRATIONS[step]}\n"
+                    f"PRAGMA user_version={step + 1};\nCOMMIT;"
+                )
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        # Refresh planner statistics so new indexes are picked up.
+        conn.execute("ANALYZE")
+
+
+def reclaim_free_pages() -> None:
+    """Return pages freed by a reload to the filesystem."""
+    with _writer_lock:
+        # executescript steps the pragma to completion; execute frees one.
+        get_writer().executescript("PRAGMA incremental_vacuum;")
+
+
+_SQL_REFRESH_META = (
+    "SELECT source_key, source_label, source_last_updated, dashboard_refreshed_at "
+    "FROM refresh_metadata ORDER BY source_key"
+)
+
+
+# (data_version, rows) of the last read; every full page shows these rows
+# and they only change when an ETL run commits.
+_refresh_meta_cache: tuple[int, list[dict]] | None = None
+_refresh_meta_lock = threading.Lock()
 
 
 def get_refresh_metadata() -> list[dict]:
-    """Return refresh metadata rows as a list of dicts."""
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT source_key, source_label, source_last_updated, dashboard_refreshed_at "
-        "FROM refresh_metadata ORDER BY source_key"
-    ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    """Return refresh metadata rows as a list of dicts.
+
+    Served from memory until the next commit moves ``data_version()``.
+    The cached list is shared; treat it as read-only.
+    """
+    global _refresh_meta_cache
+    version = data_version()
+    with _refresh_meta_lock:
+        cached = _refresh_meta_cache
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with db_txn() as conn:
+        # Plain tuples: the columns are fixed, so skip sqlite3.Row -> dict.
+        # The cursor is iterated directly rather than buffered by fetchall().
+        cur = conn.cursor()
+        cur.row_factory = None
+        cur.execute(_SQL_REFRESH_META)
+        rows = [
+            {
+                "source_key": key,
+                "source_label": label,
+                "source_last_updated": source_ts,
+                "dashboard_refreshed_at": refreshed_at,
+            }
+            for key, label, source_ts, refreshed_at in cur
+        ]
+    with _refresh_meta_lock:
+        _refresh_meta_cache = (version, rows)
+    return rows
@@ -2,10 +2,16 @@
 
 import re
 import sqlite3
-from datetime import datetime, timezone
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from itertools import product
+from typing import Iterable, Iterator
 
 from google.cloud import bigquery
-from database import get_db, init_db, DB_PATH
+from database import init_db, reclaim_free_pages, write_txn, DB_PATH
+from queries import refresh_dashboard_snapshots
 
 BQ_PROJECT = "re-ods-explorer"
 
@@ -17,8 +23,37 @@ PLBG_PROGRAM_TYPES = [
 ]
 
 
+def _program_types_config() -> bigquery.QueryJobConfig:
+    """Job config binding @program_types to PLBG_PROGRAM_TYPES.
+
+    Matching the raw column (rather than UPPER(...) LIKE) lets BigQuery
+    prune on Program_Type, and keeps the query text constant.
+    """
+    return bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("program_types", "STRING", PLBG_PROGRAM_TYPES),
+    ])
+
+
+def _to_dicts(results: bigquery.table.RowIterator) -> list[dict]:
+    """Materialise a query result as a list of plain dicts.
+
+    Large results are downloaded as Arrow batches over the BigQuery
+    Storage read API (decoded in C) when pyarrow and
+    google-cloud-bigquery-storage are installed; otherwise fall back to
+    the REST row iterator.
+    """
+    try:
+        return results.to_arrow(create_bqstorage_client=True).to_pylist()
+    except (ImportError, ValueError):
+        return [dict(row) for row in results]
+
+
 def pull_projects(client: bigquery.Client) -> list[dict]:
-    """Pull plumbing projects from qb_fmpm_project_cur."""
+    """Pull plumbing projects from qb_fmpm_project_cur.
+
+    Only the columns load_to_sqlite and the PO attribution steps read are
+    selected.
+    """
     query = """
         SELECT
             -- Use Lucernex ProjectEntityID as the canonical project ID;
@@ -36,64 +71,58 @@ def pull_projects(client: bigquery.Client) -> list[dict]:
             p.SAP_Project_Definition_Nbr AS sap_project_definition,
             COALESCE(lx.Brief_Scope_Of_Work, '') AS brief_scope_of_work,
             -- Contractor: set to NULL initially; backfilled from PO vendor
-            -- in load_to_sqlite, with Lucernex GC Firm as final fallback.
+            -- in load_to_sqlite.
             CASE
                 WHEN p.Contractor IS NOT NULL AND p.Contractor != ''
                 THEN p.Contractor
                 ELSE NULL
             END AS general_contractor,
-            -- Keep Lucernex GC Firm as a fallback (may have concatenation artifacts).
-            CASE
-                WHEN lx.GeneralContractor_Firm IS NOT NULL
-                     AND lx.GeneralContractor_Firm NOT IN ('', '!Unknown')
-                THEN lx.GeneralContractor_Firm
-                ELSE NULL
-            END AS lx_gc_firm,
-            CAST(p.Date_Modified AS STRING) AS lucernex_updated_at,
+            p.Date_Modified AS lucernex_updated_at,
             -- Budget fields
             CAST(p.SAP_Actuals AS FLOAT64) AS sap_actuals,
             CAST(p.SAP_Open_Commitments AS FLOAT64) AS sap_open_commitments,
             CAST(p.Total_Contract_Amount AS FLOAT64) AS total_contract_amount,
-            -- Contractor PO details
-            CAST(p.Contractor_SAP_PO_Nbr AS STRING) AS contractor_po_number,
+            -- Contractor PO amount (budget_committed)
             CAST(p.Contractor_SAP_PO_Amount AS FLOAT64) AS contractor_po_amount,
-            p.Contractor_Resource_Assigned AS contractor_resource,
-            -- Dates
-            CAST(p.Date_Created AS STRING) AS created_date,
-            CAST(p.Start_Date_Projected AS STRING) AS start_date_projected,
-            CAST(p.Start_Date_Actual AS STRING) AS start_date_actual,
-            CAST(p.Completion_Date_Projected AS STRING) AS completion_date_projected,
-            CAST(p.Completion_Date_Actual AS STRING) AS construction_complete_date,
-            -- FM info
-            p.FM_Sub_Region AS fm_sub_region,
-            p.Regional_Manager AS regional_manager,
-            p.Market_Manager AS market_manager,
+            -- Dates (native types; formatted by _fmt_ts on load)
+            p.Date_Created AS created_date,
+            p.Completion_Date_Actual AS construction_complete_date,
             p.Store_Type AS store_type,
-            p.Program_Group AS program_group,
             -- Comments from Lucernex
             lx.PMO_SrPM_Comments AS pmo_sr_pm_comments,
             lx.CEC_Comments AS cec_comments
         FROM `re-ods-prod.us_re_ods_prod_pub.qb_fmpm_project_cur` p
         LEFT JOIN `re-ods-prod.us_re_ods_prod_pub.lx_all_projects_curr` lx
             ON p.SAP_Project_Definition_Nbr = lx.SAPProjectDefinition
-        WHERE UPPER(p.Program_Type) LIKE '%PLBG%'
+        WHERE p.Program_Type IN UNNEST(@program_types)
           AND p.Is_Active = TRUE
         ORDER BY p.Date_Modified DESC
     """
     print("Pulling projects from BigQuery...")
-    results = client.query(query).result()
-    rows = [dict(row) for row in results]
+    results = client.query(query, job_config=_program_types_config()).result()
+    rows = _to_dicts(results)
     print(f"  Found {len(rows)} plumbing projects")
     return rows
 
 
+# PO lines with the two amount columns cast once, so the aggregates below
+# (each used twice: in the SELECT list and the HAVING) reuse the casts.
+_PO_LINES = """(
+    SELECT
+        *,
+        CAST(net_po_lc_amt AS FLOAT64) AS net_amt,
+        CAST(invoiced_lc_amt AS FLOAT64) AS inv_amt
+    FROM `re-ods-prod.us_re_ods_prod_pub.vw_rps_purchase_order`
+)"""
+
+
 def pull_purchase_orders(client: bigquery.Client) -> list[dict]:
     """Pull PO data from vw_rps_purchase_order matched to PLBG SAP definitions.
 
     Format conversion: our SAP def 'USFC-009320' → PO table 'USFC00932000000'
     (strip dash, append '00000').
     """
-    query = """
+    query = f"""
         WITH plbg_sap AS (
             SELECT DISTINCT
                 SAP_Project_Definition_Nbr,
@@ -102,7 +131,7 @@ def pull_purchase_orders(client: bigquery.Client) -> list[dict]:
                     '00000'
                 ) AS po_project_def
             FROM `re-ods-prod.us_re_ods_prod_pub.qb_fmpm_project_cur`
-            WHERE UPPER(Program_Type) LIKE '%PLBG%'
+            WHERE Program_Type IN UNNEST(@program_types)
               AND SAP_Project_Definition_Nbr IS NOT NULL
               AND SAP_Project_Definition_Nbr != ''
         )
@@ -114,23 +143,22 @@ def pull_purchase_orders(client: bigquery.Client) -> list[dict]:
             -- net_po_lc_amt holds the PO line value, invoiced_lc_amt
             -- holds the invoice receipt value. They don't overlap on
             -- the same row, so we SUM each independently.
-            SUM(CAST(po.net_po_lc_amt AS FLOAT64)) AS po_total,
-            SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) AS invoiced_to_date,
-            SUM(CAST(po.net_po_lc_amt AS FLOAT64)) -
-                SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) AS remaining_to_invoice,
+            SUM(po.net_amt) AS po_total,
+            SUM(po.inv_amt) AS invoiced_to_date,
+            SUM(po.net_amt) - SUM(po.inv_amt) AS remaining_to_invoice,
             MAX(po.pur_doc_sts) AS po_status,
-            CAST(MIN(po.document_date) AS STRING) AS created_date,
-            CAST(MAX(po.ods_updated_datetime) AS STRING) AS last_update
-        FROM `re-ods-prod.us_re_ods_prod_pub.vw_rps_purchase_order` po
+            MIN(po.document_date) AS created_date,
+            MAX(po.ods_updated_datetime) AS last_update
+        FROM {_PO_LINES} po
         INNER JOIN plbg_sap p ON po.project_definition = p.po_project_def
         GROUP BY po.po_nbr, p.SAP_Project_Definition_Nbr, po.vendor_name
-        HAVING SUM(CAST(po.net_po_lc_amt AS FLOAT64)) > 0
-            OR SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) > 0
+        HAVING SUM(po.net_amt) > 0
+            OR SUM(po.inv_amt) > 0
         ORDER BY MIN(po.document_date) DESC
     """
     print("Pulling POs from vw_rps_purchase_order...")
-    results = client.query(query).result()
-    rows = [dict(row) for row in results]
+    results = client.query(query, job_config=_program_types_config()).result()
+    rows = _to_dicts(results)
     print(f"  Found {len(rows)} PO records")
     return rows
 
@@ -144,9 +172,6 @@ _SAMS_PLUMBING_VENDORS = [
     "Stokes Plumbing",
 ]
 
-# Regex to extract the real store number from item_text like "4724UCOTanks".
-_ITEM_TEXT_STORE_RE = re.compile(r"^(\d+)UCOTank", re.IGNORECASE)
-
 
 def pull_sams_umbrella_pos(
     client: bigquery.Client,
@@ -162,6 +187,9 @@ def pull_sams_umbrella_pos(
     and encode the real store in ``item_text`` (e.g. "4724UCOTanks").
     We parse that pattern first, falling back to ``store_nbr``.
 
+    The store mapping is sent as a query parameter and joined in BigQuery,
+    so POs for stores we don't track never leave the warehouse.
+
     Args:
         client: BigQuery client.
         store_to_sap: Mapping of store number (str) to the
@@ -170,92 +198,99 @@ def pull_sams_umbrella_pos(
     Returns:
         List of PO dicts in the same shape as ``pull_purchase_orders``.
     """
+    if not store_to_sap:
+        print("  No Sam's stores to map; skipping USMS-001700 umbrella POs.")
+        return []
+
     vendor_clauses = " OR ".join(
         f"UPPER(po.vendor_name) LIKE '%{v.upper()}%'"
         for v in _SAMS_PLUMBING_VENDORS
     )
 
     query = f"""
+        WITH umbrella AS (
+            SELECT
+                po.store_nbr,
+                po.po_nbr         AS po_number,
+                po.vendor_name    AS vendor,
+                po.item_text,
+                SUM(po.net_amt) AS po_total,
+                SUM(po.inv_amt) AS invoiced_to_date,
+                SUM(po.net_amt) - SUM(po.inv_amt) AS remaining_to_invoice,
+                MAX(po.pur_doc_sts) AS po_status,
+                MIN(po.document_date) AS created_date,
+                MAX(po.ods_updated_datetime) AS last_update
+            FROM {_PO_LINES} po
+            WHERE po.project_definition = 'USMS00170000000'
+              AND ({vendor_clauses})
+            GROUP BY po.store_nbr, po.po_nbr, po.vendor_name, po.item_text
+            HAVING SUM(po.net_amt) > 0
+                OR SUM(po.inv_amt) > 0
+        )
         SELECT
-            po.store_nbr,
-            po.po_nbr         AS po_number,
-            po.vendor_name    AS vendor,
-            po.item_text,
-            SUM(CAST(po.net_po_lc_amt AS FLOAT64))  AS po_total,
-            SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) AS invoiced_to_date,
-            SUM(CAST(po.net_po_lc_amt AS FLOAT64))
-              - SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) AS remaining_to_invoice,
-            MAX(po.pur_doc_sts) AS po_status,
-            CAST(MIN(po.document_date) AS STRING) AS created_date,
-            CAST(MAX(po.ods_updated_datetime) AS STRING) AS last_update
-        FROM `re-ods-prod.us_re_ods_prod_pub.vw_rps_purchase_order` po
-        WHERE po.project_definition = 'USMS00170000000'
-          AND ({vendor_clauses})
-        GROUP BY po.store_nbr, po.po_nbr, po.vendor_name, po.item_text
-        HAVING SUM(CAST(po.net_po_lc_amt AS FLOAT64)) > 0
-            OR SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) > 0
-        ORDER BY po.store_nbr, po.po_nbr
+            u.po_number,
+            m.sap AS sap_project_definition,
+            u.vendor,
+            IFNULL(u.po_total, 0) AS po_total,
+            IFNULL(u.invoiced_to_date, 0) AS invoiced_to_date,
+            IFNULL(u.remaining_to_invoice, 0) AS remaining_to_invoice,
+            u.po_status,
+            u.created_date,
+            u.last_update
+        FROM umbrella u
+        -- Real store: "4724UCOTanks"-style item_text first, else store_nbr.
+        INNER JOIN UNNEST(@store_map) m
+            ON m.store = COALESCE(
+                REGEXP_EXTRACT(u.item_text, r'(?i)^([0-9]+)UCOTank'),
+                CAST(u.store_nbr AS STRING)
+            )
+        ORDER BY u.store_nbr, u.po_number
     """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("store_map", "STRUCT", [
+            bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter("store", "STRING", store),
+                bigquery.ScalarQueryParameter("sap", "STRING", sap_def),
+            )
+            for store, sap_def in store_to_sap.items()
+        ]),
+    ])
     print("Pulling Sam's Club USMS-001700 umbrella POs...")
-    results = client.query(query).result()
-    raw_rows = [dict(row) for row in results]
-    print(f"  Found {len(raw_rows)} raw USMS PO records")
-
-    # Map each PO to the correct USFC sap_project_definition.
-    mapped: list[dict] = []
-    skipped = 0
-    for row in raw_rows:
-        # Determine the real target store.
-        real_store = None
-        m = _ITEM_TEXT_STORE_RE.match(row.get("item_text") or "")
-        if m:
-            real_store = m.group(1)
-        if not real_store:
-            real_store = str(row["store_nbr"])
-
-        sap_def = store_to_sap.get(real_store)
-        if not sap_def:
-            skipped += 1
-            continue
+    results = client.query(query, job_config=job_config).result()
+    mapped = _to_dicts(results)
+    print(f"  Mapped {len(mapped)} POs to projects")
+    return mapped
 
-        mapped.append({
-            "po_number": row["po_number"],
-            "sap_project_definition": sap_def,
-            "vendor": row["vendor"],
-            "po_total": row["po_total"] or 0,
-            "invoiced_to_date": row["invoiced_to_date"] or 0,
-            "remaining_to_invoice": row["remaining_to_invoice"] or 0,
-            "po_status": row["po_status"],
-            "created_date": row["created_date"],
-            "last_update": row["last_update"],
-        })
 
-    print(f"  Mapped {len(mapped)} POs to projects ({skipped} skipped - no project match)")
-    return mapped
+def _store_match_score(p: dict) -> tuple[int, int]:
+    """Rank a project as a PO attribution target: non-duplicate, then active."""
+    scope = (p.get("brief_scope_of_work") or "").lower()
+    status = (p.get("project_status") or "").lower()
+    is_dupe = "duplicate" in scope or "cancelled" in scope
+    return (not is_dupe, status == "active")
 
 
 def _build_store_to_sap_map(projects: list[dict]) -> dict[str, str]:
     """Build a store -> sap_project_definition lookup from Sam's projects.
 
     When multiple projects exist for the same store, prefer the active
-    non-duplicate/non-cancelled one.
+    non-duplicate/non-cancelled one; among equals the first (most recently
+    modified) project wins.
     """
-    store_map: dict[str, str] = {}
+    best: dict[str, tuple[tuple[int, int], str]] = {}
     for p in projects:
         store = str(p.get("store") or "")
         sap_def = p.get("sap_project_definition")
         if not store or not sap_def:
             continue
 
-        scope = (p.get("brief_scope_of_work") or "").lower()
-        status = (p.get("project_status") or "").lower()
-        is_dupe = "duplicate" in scope or "cancelled" in scope
+        score = _store_match_score(p)
+        prev = best.get(store)
+        if prev is None or score > prev[0]:
+            best[store] = (score, sap_def)
 
-        # Only overwrite if this project is better (non-duplicate, active).
-        if store not in store_map or (not is_dupe and status == "active"):
-            store_map[store] = sap_def
-
-    return store_map
+    return {store: sap_def for store, (_, sap_def) in best.items()}
 
 
 # Map raw Store_Type codes to user-friendly banner labels.
@@ -271,6 +306,7 @@ _BANNER_MAP = {
 }
 
 
+@lru_cache(maxsize=64)
 def _resolve_banner(store_type: str | None) -> str:
     """Convert a BQ Store_Type code to a banner label."""
     if not store_type:
@@ -278,21 +314,91 @@ def _resolve_banner(store_type: str | None) -> str:
     return _BANNER_MAP.get(store_type.upper().strip(), "Walmart")
 
 
+def _fmt_ts(value: date | str | None) -> str | None:
+    """Render a BigQuery DATE/DATETIME/TIMESTAMP value as SQLite-friendly text."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _first_by(rows: Iterable[dict], key: str) -> Iterator[dict]:
+    """Skip rows whose ``key`` was already seen (or is missing); first wins."""
+    seen: set = set()
+    for row in rows:
+        k = row[key]
+        if k is not None and k not in seen:
+            seen.add(k)
+            yield row
+
+
+# Row builders for load_to_sqlite.  Generators, so executemany consumes
+# each tuple as it is built instead of holding a second copy of the data.
+
+def _project_rows(projects: Iterable[dict]) -> Iterator[tuple]:
+    # Deduplicated up front so the insert can skip conflict handling.
+    for p in _first_by(projects, "project_id"):
+        yield (
+            p["project_id"], p["project_type"], p["store"],
+            p["sequence"], p["store_sequence"],
+            p["city"], p["state"], p["project_status"],
+            p["sap_project_definition"], p["brief_scope_of_work"],
+            p["general_contractor"],
+            p.get("store_type"), _resolve_banner(p.get("store_type")),
+            _fmt_ts(p.get("created_date")),
+            _fmt_ts(p.get("construction_complete_date")),
+            p.get("pmo_sr_pm_comments"),
+            p.get("cec_comments"),
+            _fmt_ts(p["lucernex_updated_at"]),
+        )
+
+
+def _budget_rows(projects: Iterable[dict]) -> Iterator[tuple]:
+    # Build SAP budget from project-level fields
+    for p in projects:
+        if not p["sap_project_definition"]:
+            continue
+        budget_total = (p["sap_actuals"] or 0) + (p["sap_open_commitments"] or 0)
+        yield (
+            p["sap_project_definition"],
+            budget_total if budget_total > 0 else (p["total_contract_amount"] or 0),
+            p["sap_open_commitments"] or 0,
+            p["contractor_po_amount"] or 0,
+            p["sap_actuals"] or 0,
+            _fmt_ts(p["lucernex_updated_at"]),
+        )
+
+
+def _po_rows(pos: Iterable[dict]) -> Iterator[tuple]:
+    for po in _first_by(pos, "po_number"):
+        yield (
+            po["po_number"], po["sap_project_definition"],
+            po["vendor"], po["po_total"] or 0,
+            po["invoiced_to_date"] or 0, po["remaining_to_invoice"] or 0,
+            po["po_status"],
+            _fmt_ts(po["created_date"]), _fmt_ts(po["last_update"]),
+        )
+
+
 def load_to_sqlite(projects: list[dict], pos: list[dict]) -> None:
     """Load BigQuery data into SQLite."""
     init_db()
-    conn = get_db()
-
-    # Clear existing data
-    conn.execute("DELETE FROM sap_po")
-    conn.execute("DELETE FROM sap_budget")
-    conn.execute("DELETE FROM projects")
 
-    # Insert projects
-    for p in projects:
-        banner = _resolve_banner(p.get("store_type"))
-        conn.execute(
-            """INSERT OR IGNORE INTO projects
+    # One transaction for the whole reload: readers keep seeing the old
+    # data until it commits, and there is a single WAL sync at the end.
+    with write_txn() as conn:
+        # Clear existing data
+        conn.execute("DELETE FROM sap_po")
+        conn.execute("DELETE FROM sap_budget")
+        conn.execute("DELETE FROM projects")
+        # Rebuilt below once the new rows are committed.
+        conn.execute("DELETE FROM dashboard_snapshots")
+
+        project_count = conn.executemany(
+            """INSERT INTO projects
                (project_id, project_type, store, sequence, store_sequence,
                 city, state, project_status, sap_project_definition,
                 brief_scope_of_work, general_contractor,
@@ -301,81 +407,56 @@ def load_to_sqlite(projects: list[dict], pos: list[dict]) -> None:
                 pmo_sr_pm_comments, cec_comments,
                 lucernex_updated_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                p["project_id"], p["project_type"], p["store"],
-                p["sequence"], p["store_sequence"],
-                p["city"], p["state"], p["project_status"],
-                p["sap_project_definition"], p["brief_scope_of_work"],
-                p["general_contractor"],
-                p.get("store_type"), banner,
-                p.get("created_date"),
-                p.get("construction_complete_date"),
-                p.get("pmo_sr_pm_comments"),
-                p.get("cec_comments"),
-                p["lucernex_updated_at"],
-            ),
+            _project_rows(projects),
+        ).rowcount
+        conn.executemany(
+            """INSERT OR REPLACE INTO sap_budget
+               (sap_project_definition, budget_total, budget_open,
+                budget_committed, budget_actuals, sap_updated_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            _budget_rows(projects),
         )
+        print(f"  Loaded {project_count} projects")
 
-        # Build SAP budget from project-level fields
-        if p["sap_project_definition"]:
-            budget_total = (p["sap_actuals"] or 0) + (p["sap_open_commitments"] or 0)
-            conn.execute(
-                """INSERT OR REPLACE INTO sap_budget
-                   (sap_project_definition, budget_total, budget_open,
-                    budget_committed, budget_actuals, sap_updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (
-                    p["sap_project_definition"],
-                    budget_total if budget_total > 0 else (p["total_contract_amount"] or 0),
-                    p["sap_open_commitments"] or 0,
-                    p["contractor_po_amount"] or 0,
-                    p["sap_actuals"] or 0,
-                    p["lucernex_updated_at"],
-                ),
-            )
-
-    print(f"  Loaded {len(projects)} projects")
-
-    # Insert POs
-    po_count = 0
-    for po in pos:
-        conn.execute(
-            """INSERT OR IGNORE INTO sap_po
+        po_count = conn.executemany(
+            """INSERT INTO sap_po
                (po_number, sap_project_definition, vendor, po_total,
                 invoiced_to_date, remaining_to_invoice, po_status,
                 created_date, last_update)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                po["po_number"], po["sap_project_definition"],
-                po["vendor"], po["po_total"] or 0,
-                po["invoiced_to_date"] or 0, po["remaining_to_invoice"] or 0,
-                po["po_status"], po["created_date"], po["last_update"],
-            ),
-        )
-        po_count += 1
-
-    print(f"  Loaded {po_count} purchase orders")
-
-    # Backfill contractor from primary PO vendor (highest PO value)
-    # for ALL projects that have PO data — PO vendor is the cleanest source.
-    po_backfilled = conn.execute("""
-        UPDATE projects
-        SET general_contractor = (
-            SELECT po.vendor
-            FROM sap_po po
-            WHERE po.sap_project_definition = projects.sap_project_definition
-            GROUP BY po.vendor
-            ORDER BY SUM(po.po_total) DESC
-            LIMIT 1
-        )
-        WHERE sap_project_definition IN (
-            SELECT DISTINCT sap_project_definition FROM sap_po
-        )
-    """).rowcount
-    print(f"  Set contractor from PO vendor for {po_backfilled} projects")
-
-    conn.commit()
-    conn.close()
+            _po_rows(pos),
+        ).rowcount
+        print(f"  Loaded {po_count} purchase orders")
+
+        # The tables were just replaced wholesale; refresh their statistics
+        # so the backfill below plans against idx_sap_po_proj_vendor and
+        # idx_projects_sap (both created by init_db's migrations).
+        conn.execute("ANALYZE sap_po")
+        conn.execute("ANALYZE projects")
+
+        # Backfill contractor from primary PO vendor (highest PO value)
+        # for ALL projects that have PO data — PO vendor is the cleanest source.
+        # Vendor totals are ranked once per project rather than re-aggregated
+        # in a correlated subquery for every projects row.
+        po_backfilled = conn.execute("""
+            UPDATE projects
+            SET general_contractor = ranked.vendor
+            FROM (
+                SELECT sap_project_definition, vendor,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY sap_project_definition
+                           ORDER BY SUM(po_total) DESC, vendor
+                       ) AS rn
+                FROM sap_po
+                GROUP BY sap_project_definition, vendor
+            ) AS ranked
+            WHERE ranked.sap_project_definition = projects.sap_project_definition
+              AND ranked.rn = 1
+        """).rowcount
+        print(f"  Set contractor from PO vendor for {po_backfilled} projects")
+
+    reclaim_free_pages()
+    refresh_dashboard_snapshots()
 
 
 # ── Comment-referenced PO recovery ──────────────────────────────────
@@ -391,17 +472,30 @@ _COMMENT_PO_RE = re.compile(
 def _parse_comment_po_map(projects: list[dict]) -> dict[str, str]:
     """Parse PO numbers from PMO Sr PM Comments.
 
+    All comments are scanned in one pass over a joined buffer; each match
+    is mapped back to its project by offset.
+
     Returns:
         dict mapping po_number -> sap_project_definition.
     """
-    po_to_sap: dict[str, str] = {}
+    parts: list[str] = []
+    starts: list[int] = []
+    owners: list[str] = []
+    offset = 0
     for p in projects:
         comments = p.get("pmo_sr_pm_comments") or ""
         sap_def = p.get("sap_project_definition")
         if not comments.strip() or not sap_def:
             continue
-        for po_num in _COMMENT_PO_RE.findall(comments):
-            po_to_sap[po_num] = sap_def
+        parts.append(comments)
+        starts.append(offset)
+        owners.append(sap_def)
+        offset += len(comments) + 1
+
+    # \x01 can't be matched by the pattern, so no match spans two comments.
+    po_to_sap: dict[str, str] = {}
+    for m in _COMMENT_PO_RE.finditer("\x01".join(parts)):
+        po_to_sap[m.group(1)] = owners[bisect_right(starts, m.start()) - 1]
     return po_to_sap
 
 
@@ -427,28 +521,30 @@ def pull_comment_referenced_pos(
         return []
 
     print(f"Pulling {len(missing)} comment-referenced POs from BQ...")
-    # Build a BQ IN clause — safe because values are all \d{8}
-    in_clause = ", ".join(f"'{po}'" for po in sorted(missing))
     query = f"""
         SELECT
             po.po_nbr AS po_number,
             po.vendor_name AS vendor,
-            SUM(CAST(po.net_po_lc_amt AS FLOAT64))  AS po_total,
-            SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) AS invoiced_to_date,
-            SUM(CAST(po.net_po_lc_amt AS FLOAT64))
-              - SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) AS remaining_to_invoice,
+            SUM(po.net_amt) AS po_total,
+            SUM(po.inv_amt) AS invoiced_to_date,
+            SUM(po.net_amt) - SUM(po.inv_amt) AS remaining_to_invoice,
             MAX(po.pur_doc_sts) AS po_status,
-            CAST(MIN(po.document_date) AS STRING) AS created_date,
-            CAST(MAX(po.ods_updated_datetime) AS STRING) AS last_update
-        FROM `re-ods-prod.us_re_ods_prod_pub.vw_rps_purchase_order` po
-        WHERE po.po_nbr IN ({in_clause})
+            MIN(po.document_date) AS created_date,
+            MAX(po.ods_updated_datetime) AS last_update
+        FROM {_PO_LINES} po
+        WHERE po.po_nbr IN UNNEST(@po_nums)
         GROUP BY po.po_nbr, po.vendor_name
-        HAVING SUM(CAST(po.net_po_lc_amt AS FLOAT64)) > 0
-            OR SUM(CAST(po.invoiced_lc_amt AS FLOAT64)) > 0
+        HAVING SUM(po.net_amt) > 0
+            OR SUM(po.inv_amt) > 0
     """
-    results = client.query(query).result()
+    # Constant query text with the PO list as a parameter, so BigQuery can
+    # serve repeat runs from its results cache.
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("po_nums", "STRING", sorted(missing)),
+    ])
+    results = client.query(query, job_config=job_config).result()
     recovered: list[dict] = []
-    for row in results:
+    for row in _to_dicts(results):
         po_num = row["po_number"]
         recovered.append({
             "po_number": po_num,
@@ -477,8 +573,7 @@ WBS_NODES = {
 
 def pull_wbs_node_budgets(client: bigquery.Client) -> list[dict]:
     """Pull budget data for tracked WBS program positions, grouped by year."""
-    node_keys = ", ".join(f"'{k}'" for k in WBS_NODES)
-    query = f"""
+    query = """
         SELECT
             program_position,
             approval_year,
@@ -495,14 +590,17 @@ def pull_wbs_node_budgets(client: bigquery.Client) -> list[dict]:
             SUM(SAFE_CAST(budget_cf_from_previous_fiscal_year AS FLOAT64)) AS budget_cf_from_prev,
             SUM(SAFE_CAST(budget_cf_to_next_fiscal_year AS FLOAT64)) AS budget_cf_to_next
         FROM `re-ods-prod.us_re_ods_prod_pub.vw_rps_rb0224_us_report`
-        WHERE UPPER(program_position) IN ({node_keys})
+        WHERE UPPER(program_position) IN UNNEST(@node_keys)
           AND approval_year IS NOT NULL
         GROUP BY program_position, approval_year
         ORDER BY program_position, approval_year
     """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("node_keys", "STRING", list(WBS_NODES)),
+    ])
     print("Pulling WBS node budgets by year from RB0224 report...")
-    results = client.query(query).result()
-    rows = [dict(row) for row in results]
+    results = client.query(query, job_config=job_config).result()
+    rows = _to_dicts(results)
     years = sorted({r["approval_year"] for r in rows})
     nodes = sorted({r["program_position"] for r in rows})
     print(f"  Found {len(rows)} rows: {len(nodes)} nodes x {len(years)} years ({years})")
@@ -511,14 +609,40 @@ def pull_wbs_node_budgets(client: bigquery.Client) -> list[dict]:
 
 def load_wbs_nodes(nodes: list[dict]) -> None:
     """Upsert WBS node budget data (per year) into SQLite."""
-    conn = get_db()
-    conn.execute("DELETE FROM sap_wbs_nodes")
     now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
+    node_rows = []
     for n in nodes:
         key = n["program_position"].upper()
-        year = n.get("approval_year") or 0
-        conn.execute(
+        node_rows.append((
+            key, n.get("approval_year") or 0,
+            WBS_NODES.get(key, key), n.get("description", ""),
+            n.get("original_budget", 0) or 0,
+            n.get("supplemental_budget", 0) or 0,
+            n.get("returned_budget", 0) or 0,
+            n.get("current_budget", 0) or 0,
+            n.get("actuals", 0) or 0,
+            n.get("open_commitments", 0) or 0,
+            n.get("budget_available", 0) or 0,
+            n.get("distributed_budget", 0) or 0,
+            n.get("budget_cf_from_prev", 0) or 0,
+            n.get("budget_cf_to_next", 0) or 0,
+            n.get("project_count", 0) or 0,
+            now,
+        ))
+
+    # Placeholder rows for nodes not found in BQ (like LIFT).
+    found_keys = {n["program_position"].upper() for n in nodes}
+    all_years = sorted({n.get("approval_year", 0) for n in nodes}) or [0]
+    placeholder_rows = [
+        (key, year, label, "Not found in SAP", now)
+        for (key, label), year in product(WBS_NODES.items(), all_years)
+        if key not in found_keys
+    ]
+
+    with write_txn() as conn:
+        conn.execute("DELETE FROM sap_wbs_nodes")
+        conn.executemany(
             """INSERT OR REPLACE INTO sap_wbs_nodes
                (node_key, approval_year, node_label, description,
                 original_budget, supplemental_budget, returned_budget,
@@ -527,38 +651,14 @@ def load_wbs_nodes(nodes: list[dict]) -> None:
                 budget_cf_from_prev, budget_cf_to_next,
                 project_count, last_updated)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                key, year, WBS_NODES.get(key, key), n.get("description", ""),
-                n.get("original_budget", 0) or 0,
-                n.get("supplemental_budget", 0) or 0,
-                n.get("returned_budget", 0) or 0,
-                n.get("current_budget", 0) or 0,
-                n.get("actuals", 0) or 0,
-                n.get("open_commitments", 0) or 0,
-                n.get("budget_available", 0) or 0,
-                n.get("distributed_budget", 0) or 0,
-                n.get("budget_cf_from_prev", 0) or 0,
-                n.get("budget_cf_to_next", 0) or 0,
-                n.get("project_count", 0) or 0,
-                now,
-            ),
+            node_rows,
+        )
+        conn.executemany(
+            """INSERT OR IGNORE INTO sap_wbs_nodes
+               (node_key, approval_year, node_label, description, last_updated)
+               VALUES (?, ?, ?, ?, ?)""",
+            placeholder_rows,
         )
-
-    # Insert placeholder rows for nodes not found in BQ (like LIFT).
-    found_keys = {n["program_position"].upper() for n in nodes}
-    all_years = sorted({n.get("approval_year", 0) for n in nodes}) or [0]
-    for key, label in WBS_NODES.items():
-        if key not in found_keys:
-            for year in all_years:
-                conn.execute(
-                    """INSERT OR IGNORE INTO sap_wbs_nodes
-                       (node_key, approval_year, node_label, description, last_updated)
-                       VALUES (?, ?, ?, ?, ?)""",
-                    (key, year, label, "Not found in SAP", now),
-                )
-
-    conn.commit()
-    conn.close()
     print(f"  Loaded {len(nodes)} WBS node-year rows")
 
 
@@ -579,49 +679,103 @@ _SOURCE_FRESHNESS = {
 }
 
 
-def _record_refresh_metadata(client: bigquery.Client) -> None:
-    """Query BQ for each source's last-updated timestamp and persist."""
-    conn = get_db()
+# All freshness probes as scalar subqueries of one statement: one job
+# instead of one per source.
+_FRESHNESS_QUERY = "SELECT " + ", ".join(
+    f"({info['query']}) AS {key}" for key, info in _SOURCE_FRESHNESS.items()
+)
+
+
+def _pull_source_freshness(client: bigquery.Client) -> dict[str, str]:
+    """Query BQ for each source's last-updated timestamp.
+
+    One combined job normally; if it fails (one source missing or denied
+    sinks the whole statement), each source is probed on its own so the
+    healthy ones still report a timestamp.
+    """
+    try:
+        row = next(iter(client.query(_FRESHNESS_QUERY).result()))
+        stamps = {key: row[key] for key in _SOURCE_FRESHNESS}
+    except Exception as exc:
+        print(f"  Combined freshness query failed ({exc}); probing per source")
+        stamps = {
+            key: _probe_source_freshness(client, key, info["query"])
+            for key, info in _SOURCE_FRESHNESS.items()
+        }
+
+    freshness: dict[str, str] = {}
+    for key, ts in stamps.items():
+        # Normalize to string
+        if hasattr(ts, "strftime"):
+            freshness[key] = ts.strftime("%Y-%m-%d %H:%M:%S UTC")
+        else:
+            freshness[key] = str(ts) if ts else "Unknown"
+    return freshness
+
+
+def _probe_source_freshness(client: bigquery.Client, key: str, query: str):
+    """Run one source's freshness probe; None (reported Unknown) on failure."""
+    try:
+        return next(iter(client.query(query).result()))[0]
+    except Exception as exc:
+        print(f"  Freshness probe for {key} failed: {exc}")
+        return None
+
+
+def _record_refresh_metadata(freshness: dict[str, str]) -> None:
+    """Persist source freshness alongside the local refresh timestamp."""
     now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-    for key, info in _SOURCE_FRESHNESS.items():
-        try:
-            row = next(iter(client.query(info["query"]).result()))
-            ts = row[0]
-            # Normalize to string
-            if hasattr(ts, "strftime"):
-                source_ts = ts.strftime("%Y-%m-%d %H:%M:%S UTC")
-            else:
-                source_ts = str(ts) if ts else "Unknown"
-        except Exception:
-            source_ts = "Unknown"
-
-        conn.execute(
+    with write_txn() as conn:
+        conn.executemany(
             """INSERT OR REPLACE INTO refresh_metadata
                (source_key, source_label, source_last_updated, dashboard_refreshed_at)
                VALUES (?, ?, ?, ?)""",
-            (key, info["label"], source_ts, now),
+            [
+                (key, info["label"], freshness.get(key, "Unknown"), now)
+                for key, info in _SOURCE_FRESHNESS.items()
+            ],
         )
-
-    conn.commit()
-    conn.close()
     print(f"  Recorded refresh metadata at {now}")
 
 
+# Concurrent BigQuery pulls in run_etl.
+_ETL_WORKERS = 6
+
+
 def run_etl() -> None:
     """Execute the full ETL pipeline."""
     print(f"Starting ETL -> {DB_PATH}")
     client = bigquery.Client(project=BQ_PROJECT)
 
-    projects = pull_projects(client)
-    pos = pull_purchase_orders(client)
-
-    # Pull Sam's Club POs from the USMS-001700 umbrella project.
-    store_to_sap = _build_store_to_sap_map(projects)
-    sams_pos = pull_sams_umbrella_pos(client, store_to_sap)
+    # Every pull is a blocking BigQuery round-trip, so run them side by
+    # side.  Only the Sam's umbrella and comment-PO pulls need the
+    # projects first; everything else starts immediately.
+    with ThreadPoolExecutor(max_workers=_ETL_WORKERS) as pool:
+        projects_future = pool.submit(pull_projects, client)
+        pos_future = pool.submit(pull_purchase_orders, client)
+        wbs_future = pool.submit(pull_wbs_node_budgets, client)
+        freshness_future = pool.submit(_pull_source_freshness, client)
+
+        projects = projects_future.result()
+        sams_future = pool.submit(
+            pull_sams_umbrella_pos, client, _build_store_to_sap_map(projects)
+        )
+        pos = pos_future.result()
+        existing_po_numbers = {po["po_number"] for po in pos}
+
+        # Mine PMO Sr PM Comments for PO numbers we haven't matched yet.
+        # Runs alongside the Sam's pull; any overlap is dropped on merge.
+        comment_future = pool.submit(
+            pull_comment_referenced_pos,
+            client, _parse_comment_po_map(projects), set(existing_po_numbers),
+        )
+        sams_pos = sams_future.result()
+        comment_pos = comment_future.result()
+        wbs_nodes = wbs_future.result()
+        freshness = freshness_future.result()
 
     # Merge Sam's umbrella POs — avoid duplicate PO numbers.
-    existing_po_numbers = {po["po_number"] for po in pos}
     new_count = 0
     for spo in sams_pos:
         if spo["po_number"] not in existing_po_numbers:
@@ -630,11 +784,6 @@ def run_etl() -> None:
             new_count += 1
     print(f"  Merged {new_count} new Sam's umbrella POs (total POs: {len(pos)})")
 
-    # Mine PMO Sr PM Comments for PO numbers we haven't matched yet.
-    comment_po_map = _parse_comment_po_map(projects)
-    comment_pos = pull_comment_referenced_pos(
-        client, comment_po_map, existing_po_numbers
-    )
     comment_new = 0
     for cpo in comment_pos:
         if cpo["po_number"] not in existing_po_numbers:
@@ -645,12 +794,11 @@ def run_etl() -> None:
 
     load_to_sqlite(projects, pos)
 
-    # Pull WBS node-level budget data.
-    wbs_nodes = pull_wbs_node_budgets(client)
+    # WBS node-level budget data.
     load_wbs_nodes(wbs_nodes)
 
     # Record source freshness + local refresh timestamp.
-    _record_refresh_metadata(client)
+    _record_refresh_metadata(freshness)
 
     print("\nETL complete! Dashboard data refreshed.")
 
@@ -9,12 +9,15 @@ Usage:
     python etl_documents.py 292726       # Sync a single project
 """
 
+import hashlib
+import json
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 
-from database import get_db, init_db
-from lucernex_client import fetch_all_documents_for_project
+from database import db_txn, init_db, write_txn
+from lucernex_client import iter_all_documents_for_project
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,96 +25,189 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Projects synced concurrently by sync_all_projects (each also fans out
+# lucernex_client.FOLDER_WORKERS folder requests).
+PROJECT_WORKERS = 8
+
+# Documents written per transaction while a project's folder walk streams in.
+DOC_BATCH_SIZE = 500
+
+# Document fields compared between syncs (everything the upsert rewrites
+# apart from last_checked).
+_HASHED_FIELDS = (
+    "folder_category", "sub_folder", "doc_name", "doc_url", "doc_type",
+    "doc_size", "uploaded_by", "uploaded_at",
+)
+
+
+# Bound by name straight from the document dicts yielded by lucernex_client
+# (plus content_hash), so no per-row tuple is built.
+_UPSERT_SQL = """
+    INSERT INTO lucernex_documents
+        (doc_id, project_id, folder_id, folder_category, sub_folder,
+         doc_name, doc_url, doc_type, doc_size, uploaded_by, uploaded_at,
+         last_checked, content_hash, is_deleted)
+    VALUES
+        (:doc_id, :project_id, :folder_id, :folder_category, :sub_folder,
+         :doc_name, :doc_url, :doc_type, :doc_size, :uploaded_by,
+         :uploaded_at, :last_checked, :content_hash, 0)
+    ON CONFLICT(doc_id) DO UPDATE SET
+        folder_category = excluded.folder_category,
+        sub_folder      = excluded.sub_folder,
+        doc_name        = excluded.doc_name,
+        doc_url         = excluded.doc_url,
+        doc_type        = excluded.doc_type,
+        doc_size        = excluded.doc_size,
+        uploaded_by     = excluded.uploaded_by,
+        uploaded_at     = excluded.uploaded_at,
+        last_checked    = excluded.last_checked,
+        content_hash    = excluded.content_hash,
+        is_deleted      = 0
+"""
+
+
+def _content_hash(doc: dict) -> str:
+    """Digest of the fields a sync writes, to detect unchanged documents."""
+    return hashlib.blake2b(
+        "\x1f".join(str(doc[k]) for k in _HASHED_FIELDS).encode(),
+        digest_size=8,
+    ).hexdigest()
+
 
 def sync_project_documents(project_id: str) -> int:
     """Fetch and upsert documents for a single project.
 
+    Documents are written in batches of ``DOC_BATCH_SIZE`` as the folder
+    walk produces them, each batch in its own short write transaction, so
+    memory stays bounded and the shared writer is never held across
+    Lucernex calls.  Documents not seen are soft-deleted once the walk
+    has finished; a failed walk therefore never deletes anything.
+
     Returns the number of documents synced.
     """
     now_iso = datetime.now(timezone.utc).isoformat()
-    docs = fetch_all_documents_for_project(project_id)
+    seen: set[str] = set()
+    count = 0
+    # Last listing wins when Lucernex reports a doc_id more than once.
+    batch: dict[str, dict] = {}
+    for d in iter_all_documents_for_project(project_id, now_iso):
+        count += 1
+        batch[d["doc_id"]] = d
+        if len(batch) >= DOC_BATCH_SIZE:
+            _upsert_documents(project_id, batch, now_iso)
+            seen.update(batch)
+            batch = {}
+    if batch:
+        _upsert_documents(project_id, batch, now_iso)
+        seen.update(batch)
+
+    _soft_delete_missing(project_id, seen, now_iso)
+    return count
+
+
+def _upsert_documents(
+    project_id: str, batch: dict[str, dict], now_iso: str,
+) -> None:
+    """Write one batch of documents (keyed by doc_id) in a transaction.
+
+    Only new or changed documents are rewritten; unchanged ones just get
+    last_checked bumped.
+    """
+    ids_json = json.dumps(list(batch))
+    with write_txn() as conn:
+        stored = dict(conn.execute(
+            """SELECT doc_id, content_hash FROM lucernex_documents
+               WHERE project_id = ? AND is_deleted = 0
+                 AND doc_id IN (SELECT value FROM json_each(?))""",
+            (project_id, ids_json),
+        ))
+
+        changed = []
+        unchanged = []
+        for doc_id, d in batch.items():
+            digest = _content_hash(d)
+            if stored.get(doc_id) == digest:
+                unchanged.append(doc_id)
+                continue
+            d["content_hash"] = digest
+            changed.append(d)
+
+        conn.executemany(_UPSERT_SQL, changed)
+        if unchanged:
+            conn.execute(
+                """UPDATE lucernex_documents SET last_checked = ?
+                   WHERE doc_id IN (SELECT value FROM json_each(?))""",
+                (now_iso, json.dumps(unchanged)),
+            )
 
-    conn = get_db()
 
-    # Track which doc_ids we see in this sync.
-    seen_ids: set[str] = set()
+def _soft_delete_missing(project_id: str, seen: set[str], now_iso: str) -> None:
+    """Soft-delete the project's live documents that are not in ``seen``.
 
-    for d in docs:
-        seen_ids.add(d["doc_id"])
+    All of them when nothing came back.  The seen ids go through a temp
+    table rather than one bound parameter each, which would hit SQLite's
+    variable limit on large projects.  The temp table lives on the shared
+    writer, so it is filled and used within a single transaction.
+    """
+    with write_txn() as conn:
         conn.execute(
-            """INSERT INTO lucernex_documents
-                   (doc_id, project_id, folder_id, folder_category,
-                    sub_folder, doc_name, doc_url, doc_type, doc_size,
-                    uploaded_by, uploaded_at, last_checked, is_deleted)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
-               ON CONFLICT(doc_id) DO UPDATE SET
-                    folder_category = excluded.folder_category,
-                    sub_folder      = excluded.sub_folder,
-                    doc_name        = excluded.doc_name,
-                    doc_url         = excluded.doc_url,
-                    doc_type        = excluded.doc_type,
-                    doc_size        = excluded.doc_size,
-                    uploaded_by     = excluded.uploaded_by,
-                    uploaded_at     = excluded.uploaded_at,
-                    last_checked    = excluded.last_checked,
-                    is_deleted      = 0
-            """,
-            (
-                d["doc_id"], d["project_id"], d["folder_id"],
-                d["folder_category"], d["sub_folder"],
-                d["doc_name"], d["doc_url"], d["doc_type"],
-                d["doc_size"], d["uploaded_by"], d["uploaded_at"],
-                d["last_checked"],
-            ),
+            "CREATE TEMP TABLE IF NOT EXISTS seen_docs (doc_id TEXT PRIMARY KEY)"
         )
-
-    # Soft-delete documents no longer present in Lucernex.
-    if seen_ids:
-        placeholders = ",".join("?" for _ in seen_ids)
-        conn.execute(
-            f"""UPDATE lucernex_documents
-                SET is_deleted = 1, last_checked = ?
-                WHERE project_id = ?
-                  AND doc_id NOT IN ({placeholders})
-                  AND is_deleted = 0""",
-            [now_iso, project_id, *seen_ids],
+        conn.execute("DELETE FROM temp.seen_docs")
+        conn.executemany(
+            "INSERT INTO temp.seen_docs (doc_id) VALUES (?)",
+            ((doc_id,) for doc_id in seen),
         )
-    else:
-        # No docs returned — soft-delete all existing.
         conn.execute(
             """UPDATE lucernex_documents
                SET is_deleted = 1, last_checked = ?
-               WHERE project_id = ? AND is_deleted = 0""",
+               WHERE project_id = ?
+                 AND is_deleted = 0
+                 AND doc_id NOT IN (SELECT doc_id FROM temp.seen_docs)""",
             (now_iso, project_id),
         )
 
-    conn.commit()
-    conn.close()
-    return len(docs)
-
 
 def sync_all_projects() -> None:
-    """Sync documents for every project in the database."""
-    conn = get_db()
-    rows = conn.execute("SELECT project_id FROM projects ORDER BY project_id").fetchall()
-    conn.close()
+    """Sync documents for every project in the database.
 
-    total = len(rows)
+    Projects are synced ``PROJECT_WORKERS`` at a time; each one is mostly
+    waiting on Lucernex, and their short write transactions serialise on
+    the shared writer.
+    """
+    # Keep only the id strings; the reader goes back to the pool before any
+    # syncing starts.
+    with db_txn() as conn:
+        project_ids = [
+            row[0] for row in
+            conn.execute("SELECT project_id FROM projects ORDER BY project_id")
+        ]
+
+    total = len(project_ids)
     logger.info("Starting document sync for %d projects...", total)
 
     synced = 0
     errors = 0
-    for i, row in enumerate(rows, 1):
-        pid = row["project_id"]
-        try:
-            count = sync_project_documents(pid)
-            synced += count
-            logger.info("  [%d/%d] Project %s: %d docs", i, total, pid, count)
-        except Exception:
-            errors += 1
-            logger.error(
-                "  [%d/%d] Project %s: FAILED", i, total, pid, exc_info=True
-            )
+    with ThreadPoolExecutor(max_workers=PROJECT_WORKERS) as pool:
+        futures = {
+            pool.submit(sync_project_documents, pid): pid
+            for pid in project_ids
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            pid = futures[future]
+            try:
+                count = future.result()
+                synced += count
+                logger.info("  [%d/%d] Project %s: %d docs", i, total, pid, count)
+            except Exception:
+                errors += 1
+                logger.error(
+                    "  [%d/%d] Project %s: FAILED", i, total, pid, exc_info=True
+                )
+
+    # Refresh planner statistics now that the document table has churned.
+    with write_txn() as conn:
+        conn.execute("ANALYZE lucernex_documents")
 
     logger.info(
         "Document sync complete. %d docs synced, %d errors out of %d projects.",
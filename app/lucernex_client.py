@@ -12,16 +12,53 @@ Document retrieval flow:
 import os
 import time
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from typing import Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.util.retry import Retry
+
+# Folder listings are the bulk of a sync's CPU; parse them with orjson when
+# it is installed.  Both parsers accept the raw response bytes.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
 
 logger = logging.getLogger(__name__)
 
 BASE_URL = "https://api-walmart.lucernex.com"
 
-# Token cache (module-level singleton)
+# Concurrent folder listings per project.  Kept small: document syncs
+# for several projects can run at once (see etl_documents).
+FOLDER_WORKERS = 4
+
+# Documents requested per folder page; folders larger than this are paged.
+FOLDER_PAGE_SIZE = 200
+
+# One keep-alive session for every Lucernex call, so the folder walk reuses
+# TLS connections.  The pool covers etl_documents.PROJECT_WORKERS x
+# FOLDER_WORKERS concurrent requests; transient failures are retried with
+# backoff (GETs only — the token POST is not retried).
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3, backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+    ),
+))
+
+# Token cache (module-level singleton).  The lock makes concurrent callers
+# wait for a single refresh instead of each requesting a new JWT.
 _token_cache: dict = {"token": None, "expires_at": 0.0}
+_token_lock = threading.Lock()
 
 
 def _get_credentials() -> tuple[str, str]:
@@ -38,31 +75,78 @@ def _get_credentials() -> tuple[str, str]:
 
 def _get_token() -> str:
     """Obtain or reuse a cached JWT token from Lucernex."""
-    now = time.time()
-    if _token_cache["token"] and now < _token_cache["expires_at"] - 60:
+    if _token_cache["token"] and time.time() < _token_cache["expires_at"] - 60:
         return _token_cache["token"]
 
-    username, password = _get_credentials()
-    # Request a token valid for 60 minutes.
-    resp = requests.post(
-        f"{BASE_URL}/rest/jwt",
-        params={"expiryTimeInMinutes": 60},
-        auth=(username, password),
-        timeout=30,
-    )
-    resp.raise_for_status()
-    token = resp.text.strip().strip('"')
-    _token_cache["token"] = token
-    _token_cache["expires_at"] = now + 3500  # ~58 min buffer
-    logger.info("Lucernex JWT token acquired.")
-    return token
+    with _token_lock:
+        # Another thread may have refreshed it while we waited.
+        now = time.time()
+        if _token_cache["token"] and now < _token_cache["expires_at"] - 60:
+            return _token_cache["token"]
+
+        username, password = _get_credentials()
+        # Request a token valid for 60 minutes.
+        resp = _session.post(
+            f"{BASE_URL}/rest/jwt",
+            params={"expiryTimeInMinutes": 60},
+            auth=(username, password),
+            timeout=30,
+        )
+        resp.raise_for_status()
+        token = resp.text.strip().strip('"')
+        _token_cache["token"] = token
+        _token_cache["expires_at"] = now + 3500  # ~58 min buffer
+        logger.info("Lucernex JWT token acquired.")
+        return token
+
+
+def _invalidate_token(token: str) -> None:
+    """Drop ``token`` from the cache if it is still the current one.
+
+    Threads that were rejected with the same token then trigger a single
+    refresh between them.
+    """
+    with _token_lock:
+        if _token_cache["token"] == token:
+            _token_cache["token"] = None
+
+
+class _LucernexAuth(AuthBase):
+    """Bearer auth for every session request, refreshed once on a 401.
+
+    Lucernex can revoke a token before its expiry; the rejected request is
+    resent with a fresh token instead of failing the folder listing.
+    """
+
+    def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
+        r.headers["Authorization"] = f"Bearer {_get_token()}"
+        r.register_hook("response", self._retry_on_401)
+        return r
+
+    def _retry_on_401(self, resp: requests.Response, **kwargs) -> requests.Response:
+        if resp.status_code != 401:
+            return resp
+        rejected = resp.request.headers["Authorization"].removeprefix("Bearer ")
+        _invalidate_token(rejected)
+
+        # Release the connection before resending on it.
+        resp.content
+        resp.close()
+        prep = resp.request.copy()
+        prep.headers["Authorization"] = f"Bearer {_get_token()}"
+        # Sent on the adapter directly, so this hook doesn't fire again.
+        retry = resp.connection.send(prep, **kwargs)
+        retry.history.append(resp)
+        retry.request = prep
+        return retry
+
+
+_session.auth = _LucernexAuth()
 
 
 def _api_get(url: str, params: dict | None = None) -> requests.Response:
     """Authenticated GET request to Lucernex."""
-    token = _get_token()
-    headers = {"Authorization": f"Bearer {token}"}
-    resp = requests.get(url, params=params, headers=headers, timeout=60)
+    resp = _session.get(url, params=params, timeout=60)
     resp.raise_for_status()
     return resp
 
@@ -82,10 +166,9 @@ def get_project_folders(project_entity_id: str) -> list[dict]:
             "treeType": "peFolders",
             "peID": project_entity_id,
             "node": "root",
-            "_dc": str(int(time.time() * 1000)),
         },
     )
-    data = resp.json()
+    data = _json_loads(resp.content)
     # Lucernex may return a list or a dict with a list inside.
     if isinstance(data, dict):
         data = data.get("children", data.get("data", []))
@@ -95,7 +178,7 @@ def get_project_folders(project_entity_id: str) -> list[dict]:
 def get_folder_documents(
     folder_id: str,
     page: int = 1,
-    limit: int = 200,
+    limit: int = FOLDER_PAGE_SIZE,
 ) -> list[dict]:
     """Return documents inside a specific folder.
 
@@ -109,10 +192,9 @@ def get_folder_documents(
             "page": page,
             "start": (page - 1) * limit,
             "limit": limit,
-            "_dc": str(int(time.time() * 1000)),
         },
     )
-    data = resp.json()
+    data = _json_loads(resp.content)
     if isinstance(data, dict):
         return data.get("data", data.get("rows", []))
     return data if isinstance(data, list) else []
@@ -126,98 +208,164 @@ def build_document_url(doc_id: str, folder_id: str) -> str:
     )
 
 
-def fetch_all_documents_for_project(
+def _folders_with_files(
+    nodes: list[dict],
+) -> Iterator[tuple[str, str, str]]:
+    """Yield (folder_id, category, sub_folder) for every folder with files.
+
+    Iterative pre-order walk; top-level folders are categories and every
+    nested folder is reported as a sub-folder of its top-level category.
+    """
+    # Pushed reversed so folders pop in tree order.
+    stack = deque((n, "", 0) for n in reversed(nodes))
+    while stack:
+        node, category, depth = stack.pop()
+        folder_name = node.get("text", "")
+
+        # Determine category vs sub_folder based on depth.
+        if depth == 0:
+            cur_category = folder_name
+            cur_sub = ""
+        else:
+            cur_category = category
+            cur_sub = folder_name
+
+        num_files = node.get("numFiles", 0)
+        if num_files and num_files > 0:
+            yield str(node.get("id", "")), cur_category, cur_sub
+
+        children = node.get("children")
+        if isinstance(children, list) and children:
+            stack.extend(
+                (c, cur_category, depth + 1) for c in reversed(children)
+            )
+
+
+# Field-name variants seen in Lucernex document payloads, in priority order.
+_ID_KEYS = ("ID", "id", "documentID")
+_NAME_KEYS = ("name", "Name")
+_DATE_KEYS = ("date", "Date")
+_SIZE_KEYS = ("size", "Size")
+_UPLOADED_BY_KEYS = ("uploadedBy", "UploadedBy", "author")
+
+
+def _first(doc: dict, keys: tuple[str, ...]):
+    """Return the first non-empty value of ``keys`` in ``doc``, else ""."""
+    for key in keys:
+        value = doc.get(key)
+        if value is not None and value != "":
+            return value
+    return ""
+
+
+def _list_folder(folder: tuple[str, str, str]) -> list[dict]:
+    """Fetch every page of one folder's documents.
+
+    Pages are requested until one comes back short, or brings no document
+    not already seen (an endpoint that ignores ``page`` would otherwise
+    repeat the first page forever).  A failure is logged and re-raised, so
+    the project's sync stops before soft-deleting a partial listing.
+    """
+    folder_id, category, sub_folder = folder
+    docs: list[dict] = []
+    seen: set[str] = set()
+    page = 1
+    try:
+        while True:
+            batch = get_folder_documents(
+                folder_id, page=page, limit=FOLDER_PAGE_SIZE,
+            )
+            ids = {str(_first(d, _ID_KEYS)) for d in batch}
+            if ids <= seen:
+                return docs
+            seen |= ids
+            docs.extend(batch)
+            if len(batch) < FOLDER_PAGE_SIZE:
+                return docs
+            page += 1
+    except Exception:
+        logger.warning(
+            "Failed to list docs in folder %s (%s/%s) at page %d",
+            folder_id, category, sub_folder, page,
+        )
+        raise
+
+
+def iter_all_documents_for_project(
     project_entity_id: str,
-) -> list[dict]:
-    """Walk the full folder tree and collect every document.
+    now_iso: str | None = None,
+) -> Iterator[dict]:
+    """Walk the full folder tree and yield every document.
+
+    The tree is walked first; the per-folder document listings are then
+    fetched concurrently (up to ``FOLDER_WORKERS`` at a time) and yielded
+    folder by folder as they arrive, so callers can write batches while
+    later folders are still being listed.
+
+    ``now_iso`` stamps ``last_checked`` on every document; it defaults to
+    the current UTC time.  A folder that cannot be listed raises.
 
-    Returns a flat list of normalised document dicts ready for DB insert.
+    Yields normalised document dicts ready for DB insert.
     """
-    now_iso = datetime.now(timezone.utc).isoformat()
-    documents: list[dict] = []
-
-    folders = get_project_folders(project_entity_id)
-
-    def _walk(nodes: list[dict], category: str = "", depth: int = 0):
-        for node in nodes:
-            folder_name = node.get("text", "")
-            folder_id = str(node.get("id", ""))
-            num_files = node.get("numFiles", 0)
-
-            # Determine category vs sub_folder based on depth.
-            if depth == 0:
-                cur_category = folder_name
-                cur_sub = ""
-            else:
-                cur_category = category
-                cur_sub = folder_name
-
-            # Fetch documents if this folder has files.
-            if num_files and num_files > 0:
-                try:
-                    docs = get_folder_documents(folder_id)
-                    for doc in docs:
-                        doc_id = str(
-                            doc.get("ID", doc.get("id", doc.get("documentID", "")))
-                        )
-                        doc_name = doc.get("name", doc.get("Name", ""))
-                        doc_date = doc.get("date", doc.get("Date", ""))
-                        doc_size = doc.get("size", doc.get("Size", ""))
-                        doc_type = _guess_mime(doc_name)
-                        uploaded_by = doc.get(
-                            "uploadedBy",
-                            doc.get("UploadedBy", doc.get("author", "")),
-                        )
-
-                        documents.append({
-                            "doc_id": doc_id,
-                            "project_id": project_entity_id,
-                            "folder_id": folder_id,
-                            "folder_category": cur_category,
-                            "sub_folder": cur_sub,
-                            "doc_name": doc_name,
-                            "doc_url": build_document_url(doc_id, folder_id),
-                            "doc_type": doc_type,
-                            "doc_size": str(doc_size),
-                            "uploaded_by": str(uploaded_by),
-                            "uploaded_at": str(doc_date),
-                            "last_checked": now_iso,
-                        })
-                except Exception:
-                    logger.warning(
-                        "Failed to list docs in folder %s (%s/%s)",
-                        folder_id, cur_category, cur_sub,
-                        exc_info=True,
-                    )
-
-            # Recurse into children.
-            children = node.get("children", [])
-            if isinstance(children, list) and children:
-                _walk(children, cur_category, depth + 1)
-
-    _walk(folders)
+    if now_iso is None:
+        now_iso = datetime.now(timezone.utc).isoformat()
+    count = 0
+
+    folders = list(_folders_with_files(get_project_folders(project_entity_id)))
+    with ThreadPoolExecutor(max_workers=FOLDER_WORKERS) as pool:
+        listings = pool.map(_list_folder, folders)
+
+        for (folder_id, cur_category, cur_sub), docs in zip(folders, listings):
+            for doc in docs:
+                doc_id = str(_first(doc, _ID_KEYS))
+                doc_name = _first(doc, _NAME_KEYS)
+                doc_date = _first(doc, _DATE_KEYS)
+                doc_size = _first(doc, _SIZE_KEYS)
+                doc_type = _guess_mime(doc_name)
+                uploaded_by = _first(doc, _UPLOADED_BY_KEYS)
+
+                count += 1
+                yield {
+                    "doc_id": doc_id,
+                    "project_id": project_entity_id,
+                    "folder_id": folder_id,
+                    "folder_category": cur_category,
+                    "sub_folder": cur_sub,
+                    "doc_name": doc_name,
+                    "doc_url": build_document_url(doc_id, folder_id),
+                    "doc_type": doc_type,
+                    "doc_size": str(doc_size),
+                    "uploaded_by": str(uploaded_by),
+                    "uploaded_at": str(doc_date),
+                    "last_checked": now_iso,
+                }
+
     logger.info(
         "Fetched %d documents for project %s",
-        len(documents), project_entity_id,
+        count, project_entity_id,
     )
-    return documents
+
+
+_MIME_BY_EXT: dict[str, str] = {
+    "pdf": "application/pdf",
+    "doc": "application/msword",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "xls": "application/vnd.ms-excel",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "dwg": "application/acad",
+    "zip": "application/zip",
+    "msg": "application/vnd.ms-outlook",
+    "txt": "text/plain",
+    "csv": "text/csv",
+}
+_DEFAULT_MIME = "application/octet-stream"
 
 
 def _guess_mime(filename: str) -> str:
     """Best-effort MIME type from file extension."""
-    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
-    return {
-        "pdf": "application/pdf",
-        "doc": "application/msword",
-        "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "xls": "application/vnd.ms-excel",
-        "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        "png": "image/png",
-        "jpg": "image/jpeg",
-        "jpeg": "image/jpeg",
-        "dwg": "application/acad",
-        "zip": "application/zip",
-        "msg": "application/vnd.ms-outlook",
-        "txt": "text/plain",
-        "csv": "text/csv",
-    }.get(ext, "application/octet-stream")
+    dot = filename.rfind(".")
+    ext = filename[dot + 1:].lower() if dot >= 0 else ""
+    return _MIME_BY_EXT.get(ext, _DEFAULT_MIME)
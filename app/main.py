@@ -1,14 +1,17 @@
 """FastAPI app for the Lucernex Plumbing Projects Dashboard."""
 
+import asyncio
 import json
 import logging
+from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
 
 from fastapi import FastAPI, Request, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
-from database import init_db, get_refresh_metadata
+from database import data_version, init_db, get_refresh_metadata
 from queries import (
     SEARCH_FIELDS,
     get_all_banners,
@@ -30,13 +33,29 @@ from queries import (
 )
 
 from routes_po import router as po_router
+from streaming import stream_template
+
+# orjson is optional; when it is installed, JSON responses (notably the
+# document trees) are encoded with it instead of the stdlib encoder.
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as JSONResponse
+except ImportError:
+    from fastapi.responses import JSONResponse
 
 logger = logging.getLogger(__name__)
 
 # Track whether an ETL refresh is currently running.
 _etl_lock = {"running": False, "message": ""}
 
-app = FastAPI(title="Lucernex Plumbing Dashboard")
+# One document sync per project at a time; a second request for the same
+# project waits for the first and then syncs against fresh data.
+_doc_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+app = FastAPI(
+    title="Lucernex Plumbing Dashboard",
+    default_response_class=JSONResponse,
+)
 app.include_router(po_router)
 templates = Jinja2Templates(directory=str(Path(__file__).parent / "templates"))
 
@@ -56,12 +75,28 @@ def startup() -> None:
     init_db()
 
 
+@lru_cache(maxsize=256)
+def _chart_payloads(search: str, version: int) -> tuple[str, str, str]:
+    """Serialised chart data for one search, memoised per DB data version.
+
+    ``version`` is only part of the cache key: any commit moves it on, so
+    stale payloads are never served and simply age out of the LRU.  This
+    is the only in-process cache over the chart queries; unfiltered ones
+    read their dashboard_snapshots row underneath.
+    """
+    return (
+        json.dumps(get_projects_by_type(search=search)),
+        json.dumps(get_projects_by_status(search=search)),
+        json.dumps(get_budget_by_type(search=search)),
+    )
+
+
 def _dashboard_context(request: Request, search: str | None = None) -> dict:
     """Shared context builder for full dashboard and HTMX partial."""
     stats = get_summary_stats(search=search)
-    by_type = get_projects_by_type(search=search)
-    by_status = get_projects_by_status(search=search)
-    budget_by_type = get_budget_by_type(search=search)
+    by_type_json, by_status_json, budget_by_type_json = _chart_payloads(
+        search or "", data_version(),
+    )
     contractors = get_top_contractors(search=search)
     po_summary = get_po_status_summary(search=search)
 
@@ -71,9 +106,9 @@ def _dashboard_context(request: Request, search: str | None = None) -> dict:
     return {
         "request": request,
         "stats": stats,
-        "by_type_json": json.dumps(by_type),
-        "by_status_json": json.dumps(by_status),
-        "budget_by_type_json": json.dumps(budget_by_type),
+        "by_type_json": by_type_json,
+        "by_status_json": by_status_json,
+        "budget_by_type_json": budget_by_type_json,
         "contractors": contractors,
         "po_summary": po_summary,
         "wbs_nodes": wbs_nodes,
@@ -167,7 +202,11 @@ def projects_table_partial(
     sort: str = Query(None),
     order: str = Query(None),
 ):
-    """HTMX partial: just the table body for filtering/sorting."""
+    """HTMX partial: just the table body for filtering/sorting.
+
+    Rows are fetched up front so no pooled reader is held while a slow
+    client drains the response; the HTML is then streamed as it renders.
+    """
     active_fields = parse_search_fields(search_fields)
     projects = get_all_projects(
         project_type=project_type, status=status,
@@ -175,7 +214,7 @@ def projects_table_partial(
         search=search, search_fields=active_fields,
         sort=sort, order=order,
     )
-    return templates.TemplateResponse("partials/projects_table.html", {
+    return stream_template(templates, "partials/projects_table.html", {
         "request": request,
         "projects": projects,
         "sort": sort or "project_id",
@@ -197,20 +236,28 @@ def api_project_documents(project_id: str):
     })
 
 
+async def _sync_documents(project_id: str) -> int:
+    """Run a project's (blocking) document sync in a worker thread."""
+    from etl_documents import sync_project_documents
+    async with _doc_locks[project_id]:
+        return await asyncio.to_thread(sync_project_documents, project_id)
+
+
 @app.post("/api/projects/{project_id}/documents/refresh")
-def api_refresh_project_documents(project_id: str):
+async def api_refresh_project_documents(project_id: str):
     """Trigger a live Lucernex document sync for a single project (JSON)."""
     try:
-        from etl_documents import sync_project_documents
-        count = sync_project_documents(project_id)
+        count = await _sync_documents(project_id)
     except EnvironmentError as exc:
         return JSONResponse({"error": str(exc)}, status_code=500)
     except Exception as exc:
         logger.error("Document refresh failed for %s", project_id, exc_info=True)
         return JSONResponse({"error": f"Refresh failed: {exc}"}, status_code=500)
 
-    tree = get_project_documents_tree(project_id)
-    last_checked = get_project_doc_last_checked(project_id)
+    tree = await asyncio.to_thread(get_project_documents_tree, project_id)
+    last_checked = await asyncio.to_thread(
+        get_project_doc_last_checked, project_id
+    )
     return JSONResponse({
         "project_id": project_id,
         "doc_count": count,
@@ -220,20 +267,19 @@ def api_refresh_project_documents(project_id: str):
 
 
 @app.post("/projects/{project_id}/documents/sync", response_class=HTMLResponse)
-def htmx_sync_project_documents(request: Request, project_id: str):
+async def htmx_sync_project_documents(request: Request, project_id: str):
     """HTMX endpoint: sync documents and return the updated panel partial."""
     sync_error = ""
     try:
-        from etl_documents import sync_project_documents
-        sync_project_documents(project_id)
+        await _sync_documents(project_id)
     except EnvironmentError as exc:
         sync_error = str(exc)
     except Exception as exc:
         logger.error("Document sync failed for %s", project_id, exc_info=True)
         sync_error = f"Sync failed: {exc}"
 
-    doc_tree = get_project_documents_tree(project_id)
-    doc_count = get_project_doc_count(project_id)
+    doc_tree = await asyncio.to_thread(get_project_documents_tree, project_id)
+    doc_count = await asyncio.to_thread(get_project_doc_count, project_id)
 
     return templates.TemplateResponse("partials/documents_panel.html", {
         "request": request,
@@ -281,7 +327,6 @@ async def api_refresh_data():
     _etl_lock["running"] = True
     _etl_lock["message"] = ""
     try:
-        import asyncio
         from etl import run_etl
         # Run the (blocking) ETL in a thread so we don't stall the event loop.
         await asyncio.to_thread(run_etl)
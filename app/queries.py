@@ -1,106 +1,154 @@
 """Database query functions for the plumbing dashboard."""
 
+import json
 import logging
+from datetime import datetime, timezone
+from functools import lru_cache, wraps
+from itertools import groupby
+from operator import itemgetter
+from typing import Callable
 
-from database import get_db
+from database import db_txn, fetch_dicts, write_txn
+from querycache import ttl_cache
 
 logger = logging.getLogger(__name__)
 
 
+# ── Dashboard snapshots ──────────────────────────────────────────────
+# The unfiltered chart aggregates only change when the ETL reloads the
+# tables, so each load stores them in dashboard_snapshots and the charts
+# read one row instead of re-grouping every project.
+#
+# The three chart queries have no ttl_cache: their only dashboard caller,
+# main._chart_payloads, memoises the serialised result per search and
+# data_version.  The panel aggregates used directly by the dashboard
+# (summary stats, top contractors, PO status) keep ttl_cache, which is
+# also keyed on data_version, for searched requests.
+
+_SNAPSHOT_SOURCES: dict[str, Callable] = {}
+
+
+def _snapshot(endpoint: str):
+    """Serve a ``fn(search)`` query from its snapshot when unfiltered.
+
+    Falls back to the live query when the search is set or no snapshot
+    exists yet (new database, or a load that has not finished).
+    """
+    def decorator(func):
+        _SNAPSHOT_SOURCES[endpoint] = func
+
+        @wraps(func)
+        def wrapper(search: str | None = None):
+            if not search:
+                with db_txn() as conn:
+                    row = conn.execute(
+                        "SELECT payload_json FROM dashboard_snapshots"
+                        " WHERE endpoint = ?",
+                        (endpoint,),
+                    ).fetchone()
+                if row is not None:
+                    return json.loads(row[0])
+            return func(search)
+        return wrapper
+    return decorator
+
+
+def refresh_dashboard_snapshots() -> None:
+    """Recompute every snapshot from the live tables.
+
+    Called after each load; the load itself clears the old snapshots in
+    its transaction, so stale ones are never served.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [
+        (endpoint, json.dumps(func(None)), now)
+        for endpoint, func in _SNAPSHOT_SOURCES.items()
+    ]
+    with write_txn() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO dashboard_snapshots"
+            " (endpoint, payload_json, refreshed_at) VALUES (?, ?, ?)",
+            rows,
+        )
+    logger.info("Refreshed %d dashboard snapshots", len(rows))
+
+
+@ttl_cache(seconds=60)
 def get_summary_stats(search: str | None = None) -> dict:
     """Return high-level KPI stats for the dashboard."""
     search_clause, search_params = _build_search_clause(search)
     # When searching, scope budget/PO stats to matched projects only.
-    proj_filter = f" WHERE 1=1 {search_clause}" if search_clause else ""
     sap_filter = (
-        f" WHERE sap_project_definition IN "
-        f"(SELECT sap_project_definition FROM projects p WHERE 1=1 {search_clause})"
+        " WHERE sap_project_definition IN"
+        " (SELECT sap_project_definition FROM matched)"
         if search_clause else ""
     )
 
-    conn = get_db()
-    stats = {}
-
-    row = conn.execute(
-        f"SELECT COUNT(*) as cnt FROM projects p{proj_filter}", search_params
-    ).fetchone()
-    stats["total_projects"] = row["cnt"]
-
-    row = conn.execute(
-        f"SELECT COUNT(*) as cnt FROM projects p WHERE project_status = 'Active'{search_clause}",
-        search_params,
-    ).fetchone()
-    stats["active_projects"] = row["cnt"]
-
-    row = conn.execute(
-        f"SELECT COALESCE(SUM(budget_total), 0) as total FROM sap_budget{sap_filter}",
-        search_params,
-    ).fetchone()
-    stats["total_budget"] = row["total"]
-
-    row = conn.execute(
-        f"SELECT COALESCE(SUM(budget_actuals), 0) as total FROM sap_budget{sap_filter}",
-        search_params,
-    ).fetchone()
-    stats["total_actuals"] = row["total"]
-
-    row = conn.execute(
-        f"SELECT COALESCE(SUM(remaining_to_invoice), 0) as total FROM sap_po{sap_filter}",
-        search_params,
-    ).fetchone()
-    stats["remaining_to_invoice"] = row["total"]
-
-    row = conn.execute(
-        f"SELECT COUNT(*) as cnt FROM sap_po{sap_filter}", search_params
-    ).fetchone()
-    stats["total_pos"] = row["cnt"]
-
-    conn.close()
-    return stats
-
-
+    # One statement, one pass per table; the search params bind once.
+    with db_txn() as conn:
+        row = conn.execute(
+            f"""WITH matched AS (
+                    SELECT project_status, sap_project_definition
+                    FROM projects p WHERE 1=1{search_clause}
+                )
+                SELECT * FROM
+                    (SELECT COUNT(*) AS total_projects,
+                            COALESCE(SUM(project_status = 'Active'), 0)
+                                AS active_projects
+                     FROM matched),
+                    (SELECT COALESCE(SUM(budget_total), 0) AS total_budget,
+                            COALESCE(SUM(budget_actuals), 0) AS total_actuals
+                     FROM sap_budget{sap_filter}),
+                    (SELECT COALESCE(SUM(remaining_to_invoice), 0)
+                                AS remaining_to_invoice,
+                            COUNT(*) AS total_pos
+                     FROM sap_po{sap_filter})""",
+            search_params,
+        ).fetchone()
+        return dict(row)
+
+
+@_snapshot("projects_by_type")
 def get_projects_by_type(search: str | None = None) -> list[dict]:
     """Return project counts grouped by type."""
     search_clause, search_params = _build_search_clause(search)
-    conn = get_db()
-    rows = conn.execute(
-        f"SELECT project_type, COUNT(*) as cnt FROM projects p WHERE 1=1{search_clause} GROUP BY project_type ORDER BY cnt DESC",
-        search_params,
-    ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    with db_txn() as conn:
+        return fetch_dicts(
+            conn,
+            f"SELECT project_type, COUNT(*) as cnt FROM projects p WHERE 1=1{search_clause} GROUP BY project_type ORDER BY cnt DESC",
+            search_params,
+        )
 
 
+@_snapshot("projects_by_status")
 def get_projects_by_status(search: str | None = None) -> list[dict]:
     """Return project counts grouped by status."""
     search_clause, search_params = _build_search_clause(search)
-    conn = get_db()
-    rows = conn.execute(
-        f"SELECT project_status, COUNT(*) as cnt FROM projects p WHERE 1=1{search_clause} GROUP BY project_status ORDER BY cnt DESC",
-        search_params,
-    ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    with db_txn() as conn:
+        return fetch_dicts(
+            conn,
+            f"SELECT project_status, COUNT(*) as cnt FROM projects p WHERE 1=1{search_clause} GROUP BY project_status ORDER BY cnt DESC",
+            search_params,
+        )
 
 
+@_snapshot("budget_by_type")
 def get_budget_by_type(search: str | None = None) -> list[dict]:
     """Return budget totals grouped by project type."""
     search_clause, search_params = _build_search_clause(search)
-    conn = get_db()
-    rows = conn.execute(f"""
-        SELECT p.project_type,
-               COALESCE(SUM(b.budget_total), 0) as budget_total,
-               COALESCE(SUM(b.budget_actuals), 0) as budget_actuals,
-               COALESCE(SUM(b.budget_committed), 0) as budget_committed,
-               COALESCE(SUM(b.budget_open), 0) as budget_open
-        FROM projects p
-        LEFT JOIN sap_budget b ON p.sap_project_definition = b.sap_project_definition
-        WHERE 1=1{search_clause}
-        GROUP BY p.project_type
-        ORDER BY budget_total DESC
-    """, search_params).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    with db_txn() as conn:
+        return fetch_dicts(conn, f"""
+            SELECT p.project_type,
+                   COALESCE(SUM(b.budget_total), 0) as budget_total,
+                   COALESCE(SUM(b.budget_actuals), 0) as budget_actuals,
+                   COALESCE(SUM(b.budget_committed), 0) as budget_committed,
+                   COALESCE(SUM(b.budget_open), 0) as budget_open
+            FROM projects p
+            LEFT JOIN sap_budget b ON p.sap_project_definition = b.sap_project_definition
+            WHERE 1=1{search_clause}
+            GROUP BY p.project_type
+            ORDER BY budget_total DESC
+        """, search_params)
 
 
 # ── Reusable search-clause builder ───────────────────────────────────
@@ -157,33 +205,43 @@ def _build_search_clause(
     if not terms:
         return "", []
 
-    active = fields if fields else _ALL_FIELD_KEYS
+    active = tuple(fields or _ALL_FIELD_KEYS)
+    fragment, n_params = _search_term_fragment(active, table_alias)
+    if not fragment:
+        return "", []
 
-    clauses: list[str] = []
-    params: list = []
-    for term in terms:
-        like = f"%{term}%"
-        or_parts: list[str] = []
-        for key in active:
-            meta = SEARCH_FIELDS[key]
-            if meta["col"] == "__po_subquery__":
-                or_parts.append(
-                    f"{table_alias}.sap_project_definition IN ("
-                    f"SELECT po.sap_project_definition FROM sap_po po "
-                    f"WHERE po.po_number LIKE ? OR po.vendor LIKE ?)"
-                )
-                params.extend([like, like])
-            else:
-                col = meta["col"].replace("{t}", table_alias)
-                or_parts.append(f"{col} LIKE ?")
-                params.append(like)
+    # Every term repeats the same OR-group, bound to its own LIKE pattern.
+    params = [f"%{term}%" for term in terms for _ in range(n_params)]
+    return f" AND ({' AND '.join([fragment] * len(terms))})", params
 
-        if or_parts:
-            clauses.append(f"({' OR '.join(or_parts)})")
 
-    if not clauses:
-        return "", []
-    return f" AND ({' AND '.join(clauses)})", params
+@lru_cache(maxsize=64)
+def _search_term_fragment(
+    active: tuple[str, ...], table_alias: str,
+) -> tuple[str, int]:
+    """Return one term's OR-group over ``active`` fields and its ? count.
+
+    Depends only on the field selection and alias, so it is built once
+    per combination rather than on every search.
+    """
+    or_parts: list[str] = []
+    n_params = 0
+    for key in active:
+        meta = SEARCH_FIELDS[key]
+        if meta["col"] == "__po_subquery__":
+            or_parts.append(
+                f"{table_alias}.sap_project_definition IN ("
+                f"SELECT po.sap_project_definition FROM sap_po po "
+                f"WHERE po.po_number LIKE ? OR po.vendor LIKE ?)"
+            )
+            n_params += 2
+        else:
+            col = meta["col"].replace("{t}", table_alias)
+            or_parts.append(f"{col} LIKE ?")
+            n_params += 1
+    if not or_parts:
+        return "", 0
+    return f"({' OR '.join(or_parts)})", n_params
 
 
 # Allowlisted sort columns to prevent SQL injection.
@@ -218,8 +276,26 @@ def get_all_projects(
     Budget/actuals are derived from PO data (the accurate source),
     falling back to sap_budget when no POs exist for a project.
     """
-    conn = get_db()
-    query = """
+    query, params = _all_projects_query(
+        project_type, status, contractor, banner,
+        search, search_fields, sort, order,
+    )
+    with db_txn() as conn:
+        return fetch_dicts(conn, query, params)
+
+
+def _all_projects_query(
+    project_type: str | None,
+    status: str | None,
+    contractor: str | None,
+    banner: str | None,
+    search: str | None,
+    search_fields: list[str] | None,
+    sort: str | None,
+    order: str | None,
+) -> tuple[str, list]:
+    """Build the projects-list SQL and its params."""
+    parts = ["""
         SELECT p.*,
             -- Use PO totals as primary source; fall back to sap_budget.
             COALESCE(po_agg.total_po, b.budget_total, 0) AS budget_total,
@@ -232,143 +308,160 @@ def get_all_projects(
         FROM projects p
         LEFT JOIN sap_budget b
             ON p.sap_project_definition = b.sap_project_definition
-        LEFT JOIN (
-            SELECT sap_project_definition,
-                   SUM(po_total) AS total_po,
-                   SUM(invoiced_to_date) AS total_invoiced
-            FROM sap_po
-            GROUP BY sap_project_definition
-        ) po_agg ON p.sap_project_definition = po_agg.sap_project_definition
+        LEFT JOIN sap_po_agg po_agg
+            ON p.sap_project_definition = po_agg.sap_project_definition
         WHERE 1=1
-    """
+    """]
     params: list = []
 
     if project_type:
-        query += " AND p.project_type = ?"
+        parts.append(" AND p.project_type = ?")
         params.append(project_type)
     if status:
-        query += " AND p.project_status = ?"
+        parts.append(" AND p.project_status = ?")
         params.append(status)
     if contractor:
-        query += " AND p.general_contractor = ?"
+        parts.append(" AND p.general_contractor = ?")
         params.append(contractor)
     if banner:
-        query += " AND p.banner = ?"
+        parts.append(" AND p.banner = ?")
         params.append(banner)
     search_clause, search_params = _build_search_clause(
         search, fields=search_fields,
     )
     if search_clause:
-        query += search_clause
+        parts.append(search_clause)
         params.extend(search_params)
 
     sort_col = _SORT_COLUMNS.get(sort, "p.project_id")
     sort_dir = "DESC" if order == "desc" else "ASC"
-    query += f" ORDER BY {sort_col} {sort_dir}"
-
-    rows = conn.execute(query, params).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    parts.append(f" ORDER BY {sort_col} {sort_dir}")
+    return "".join(parts), params
 
 
+@ttl_cache(seconds=300)
 def get_all_contractors() -> list[str]:
     """Return distinct contractor names for the filter dropdown."""
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT DISTINCT general_contractor FROM projects WHERE general_contractor IS NOT NULL AND general_contractor != '' ORDER BY general_contractor"
-    ).fetchall()
-    conn.close()
-    return [r["general_contractor"] for r in rows]
+    with db_txn() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT general_contractor FROM projects WHERE general_contractor IS NOT NULL AND general_contractor != '' ORDER BY general_contractor"
+        ).fetchall()
+        return [r["general_contractor"] for r in rows]
 
 
+@ttl_cache(seconds=300)
 def get_all_banners() -> list[str]:
     """Return distinct banner labels for the filter dropdown."""
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT DISTINCT banner FROM projects WHERE banner IS NOT NULL ORDER BY banner"
-    ).fetchall()
-    conn.close()
-    return [r["banner"] for r in rows]
+    with db_txn() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT banner FROM projects WHERE banner IS NOT NULL ORDER BY banner"
+        ).fetchall()
+        return [r["banner"] for r in rows]
 
 
 def get_project_detail(project_id: str) -> dict | None:
-    """Return a single project with budget and POs."""
-    conn = get_db()
-    project = conn.execute(
-        "SELECT * FROM projects WHERE project_id = ?", (project_id,)
-    ).fetchone()
-    if not project:
-        conn.close()
-        return None
+    """Return a single project with budget and POs.
 
-    project = dict(project)
-    budget = conn.execute(
-        "SELECT * FROM sap_budget WHERE sap_project_definition = ?",
-        (project["sap_project_definition"],),
-    ).fetchone()
-    project["budget"] = dict(budget) if budget else None
+    One LEFT JOINed statement: every row repeats the project and budget
+    columns, followed by one PO (NULLs when the project has none).  The
+    marker columns delimit the three tables' ``*`` expansions.
+    """
+    with db_txn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None  # plain tuples; sliced per table below
+        rows = cur.execute(
+            """SELECT p.*, NULL AS _budget, b.*, NULL AS _po, po.*
+               FROM projects p
+               LEFT JOIN sap_budget b
+                   ON b.sap_project_definition = p.sap_project_definition
+               LEFT JOIN sap_po po
+                   ON po.sap_project_definition = p.sap_project_definition
+               WHERE p.project_id = ?
+               ORDER BY po.created_date""",
+            (project_id,),
+        ).fetchall()
+        cols = [d[0] for d in cur.description]
+    if not rows:
+        return None
 
-    pos = conn.execute(
-        "SELECT * FROM sap_po WHERE sap_project_definition = ? ORDER BY created_date",
-        (project["sap_project_definition"],),
-    ).fetchall()
-    project["purchase_orders"] = [dict(po) for po in pos]
+    b_start = cols.index("_budget") + 1
+    po_start = cols.index("_po") + 1
+    budget_cols = cols[b_start:po_start - 1]
+    po_cols = cols[po_start:]
+    # Primary keys are NOT NULL, so a NULL one means "no joined row".
+    b_key = b_start + budget_cols.index("sap_project_definition")
+    po_key = po_start + po_cols.index("po_number")
+    # activity_day is an index-only generated column, not part of the PO.
+    po_fields = [
+        (po_start + i, name) for i, name in enumerate(po_cols)
+        if name != "activity_day"
+    ]
 
-    conn.close()
+    first = rows[0]
+    project = dict(zip(cols[:b_start - 1], first))
+    project["budget"] = (
+        dict(zip(budget_cols, first[b_start:po_start - 1]))
+        if first[b_key] is not None else None
+    )
+    project["purchase_orders"] = [
+        {name: r[i] for i, name in po_fields}
+        for r in rows if r[po_key] is not None
+    ]
     return project
 
 
+@ttl_cache(seconds=60)
+@_snapshot("top_contractors")
 def get_top_contractors(search: str | None = None) -> list[dict]:
     """Return top general contractors by project count."""
     search_clause, search_params = _build_search_clause(search)
-    conn = get_db()
-    rows = conn.execute(f"""
-        SELECT general_contractor, COUNT(*) as project_count,
-               COALESCE(SUM(b.budget_total), 0) as total_budget
-        FROM projects p
-        LEFT JOIN sap_budget b ON p.sap_project_definition = b.sap_project_definition
-        WHERE 1=1{search_clause}
-        GROUP BY general_contractor
-        ORDER BY project_count DESC
-        LIMIT 10
-    """, search_params).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
-
-
+    with db_txn() as conn:
+        return fetch_dicts(conn, f"""
+            SELECT general_contractor, COUNT(*) as project_count,
+                   COALESCE(SUM(b.budget_total), 0) as total_budget
+            FROM projects p
+            LEFT JOIN sap_budget b ON p.sap_project_definition = b.sap_project_definition
+            WHERE 1=1{search_clause}
+            GROUP BY general_contractor
+            ORDER BY project_count DESC
+            LIMIT 10
+        """, search_params)
+
+
+@ttl_cache(seconds=60)
+@_snapshot("po_status_summary")
 def get_po_status_summary(search: str | None = None) -> list[dict]:
     """Return PO counts grouped by status."""
     search_clause, search_params = _build_search_clause(search)
-    conn = get_db()
-    if search_clause:
-        # Scope POs to matched projects.
-        rows = conn.execute(f"""
-            SELECT po_status, COUNT(*) as cnt, SUM(po_total) as total
-            FROM sap_po
-            WHERE sap_project_definition IN (
-                SELECT sap_project_definition FROM projects p WHERE 1=1{search_clause}
+    with db_txn() as conn:
+        if search_clause:
+            # Scope POs to matched projects.
+            rows = fetch_dicts(conn, f"""
+                SELECT po_status, COUNT(*) as cnt, SUM(po_total) as total
+                FROM sap_po
+                WHERE sap_project_definition IN (
+                    SELECT sap_project_definition FROM projects p WHERE 1=1{search_clause}
+                )
+                GROUP BY po_status ORDER BY cnt DESC
+            """, search_params)
+        else:
+            rows = fetch_dicts(
+                conn,
+                "SELECT po_status, COUNT(*) as cnt, SUM(po_total) as total FROM sap_po GROUP BY po_status ORDER BY cnt DESC"
             )
-            GROUP BY po_status ORDER BY cnt DESC
-        """, search_params).fetchall()
-    else:
-        rows = conn.execute(
-            "SELECT po_status, COUNT(*) as cnt, SUM(po_total) as total FROM sap_po GROUP BY po_status ORDER BY cnt DESC"
-        ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+        return rows
 
 
 # ── SAP WBS Node Budgets ─────────────────────────────────────────
 
 def get_wbs_node_years() -> list[int]:
     """Return distinct fiscal years available in WBS node data."""
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT DISTINCT approval_year FROM sap_wbs_nodes "
-        "WHERE approval_year > 0 ORDER BY approval_year DESC"
-    ).fetchall()
-    conn.close()
-    return [r["approval_year"] for r in rows]
+    with db_txn() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT approval_year FROM sap_wbs_nodes "
+            "WHERE approval_year > 0 ORDER BY approval_year DESC"
+        ).fetchall()
+        return [r["approval_year"] for r in rows]
 
 
 def get_wbs_node_budgets(year: int | None = None) -> list[dict]:
@@ -376,39 +469,45 @@ def get_wbs_node_budgets(year: int | None = None) -> list[dict]:
 
     If year is None, aggregates across all years.
     """
-    conn = get_db()
-    if year:
-        rows = conn.execute(
-            "SELECT * FROM sap_wbs_nodes WHERE approval_year = ? ORDER BY node_key",
-            (year,),
-        ).fetchall()
-    else:
-        # Aggregate across all years per node.
-        rows = conn.execute("""
-            SELECT node_key, node_label, MAX(description) AS description,
-                   0 AS approval_year,
-                   SUM(original_budget) AS original_budget,
-                   SUM(supplemental_budget) AS supplemental_budget,
-                   SUM(returned_budget) AS returned_budget,
-                   SUM(current_budget) AS current_budget,
-                   SUM(actuals) AS actuals,
-                   SUM(open_commitments) AS open_commitments,
-                   SUM(budget_available) AS budget_available,
-                   SUM(distributed_budget) AS distributed_budget,
-                   SUM(budget_cf_from_prev) AS budget_cf_from_prev,
-                   SUM(budget_cf_to_next) AS budget_cf_to_next,
-                   SUM(project_count) AS project_count,
-                   MAX(last_updated) AS last_updated
-            FROM sap_wbs_nodes
-            GROUP BY node_key, node_label
-            ORDER BY node_key
-        """).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    with db_txn() as conn:
+        if year:
+            rows = fetch_dicts(
+                conn,
+                "SELECT * FROM sap_wbs_nodes WHERE approval_year = ? ORDER BY node_key",
+                (year,),
+            )
+        else:
+            # Aggregate across all years per node.
+            rows = fetch_dicts(conn, """
+                SELECT node_key, node_label, MAX(description) AS description,
+                       0 AS approval_year,
+                       SUM(original_budget) AS original_budget,
+                       SUM(supplemental_budget) AS supplemental_budget,
+                       SUM(returned_budget) AS returned_budget,
+                       SUM(current_budget) AS current_budget,
+                       SUM(actuals) AS actuals,
+                       SUM(open_commitments) AS open_commitments,
+                       SUM(budget_available) AS budget_available,
+                       SUM(distributed_budget) AS distributed_budget,
+                       SUM(budget_cf_from_prev) AS budget_cf_from_prev,
+                       SUM(budget_cf_to_next) AS budget_cf_to_next,
+                       SUM(project_count) AS project_count,
+                       MAX(last_updated) AS last_updated
+                FROM sap_wbs_nodes
+                GROUP BY node_key, node_label
+                ORDER BY node_key
+            """)
+        return rows
 
 
 # ── Lucernex Documents ───────────────────────────────────────────────
 
+_DOC_TREE_FIELDS = (
+    "doc_id", "doc_name", "doc_url", "doc_type", "doc_size",
+    "uploaded_by", "uploaded_at",
+)
+
+
 def get_project_documents_tree(project_id: str) -> list[dict]:
     """Return a pre-aggregated folder → sub-folder → docs tree.
 
@@ -427,61 +526,55 @@ def get_project_documents_tree(project_id: str) -> list[dict]:
 
     Only folders/sub-folders with ≥1 active document are included.
     """
-    conn = get_db()
-    rows = conn.execute(
-        """SELECT doc_id, folder_category, sub_folder, doc_name,
-                  doc_url, doc_type, doc_size, uploaded_by, uploaded_at
-           FROM lucernex_documents
-           WHERE project_id = ? AND is_deleted = 0
-           ORDER BY folder_category, sub_folder, doc_name""",
-        (project_id,),
-    ).fetchall()
-    conn.close()
-
-    # Build nested tree from flat rows.
-    from collections import OrderedDict
-
-    categories: OrderedDict[str, OrderedDict[str, list[dict]]] = OrderedDict()
-    for r in rows:
-        cat = r["folder_category"] or "Uncategorised"
-        sub = r["sub_folder"] or "General"
-        categories.setdefault(cat, OrderedDict()).setdefault(sub, []).append({
-            "doc_id": r["doc_id"],
-            "doc_name": r["doc_name"],
-            "doc_url": r["doc_url"],
-            "doc_type": r["doc_type"],
-            "doc_size": r["doc_size"],
-            "uploaded_by": r["uploaded_by"],
-            "uploaded_at": r["uploaded_at"],
-        })
-
-    tree: list[dict] = []
-    for cat_name, subs in categories.items():
-        subfolders = [
-            {"sub_folder": sf_name, "docs": docs}
-            for sf_name, docs in subs.items()
+    with db_txn() as conn:
+        # Sort on the grouping labels themselves, so NULL, '' and a folder
+        # literally named "General" land together and groupby can stream
+        # the tree in a single pass.
+        rows = conn.cursor()
+        rows.row_factory = None
+        rows.execute(
+            """SELECT COALESCE(NULLIF(folder_category, ''), 'Uncategorised'),
+                      COALESCE(NULLIF(sub_folder, ''), 'General'),
+                      doc_id, doc_name, doc_url, doc_type, doc_size,
+                      uploaded_by, uploaded_at
+               FROM lucernex_documents
+               WHERE project_id = ? AND is_deleted = 0
+               ORDER BY 1, 2, doc_name""",
+            (project_id,),
+        )
+
+        return [
+            {
+                "folder_category": cat_name,
+                "subfolders": [
+                    {
+                        "sub_folder": sf_name,
+                        "docs": [
+                            dict(zip(_DOC_TREE_FIELDS, r[2:])) for r in docs
+                        ],
+                    }
+                    for sf_name, docs in groupby(cat_rows, key=itemgetter(1))
+                ],
+            }
+            for cat_name, cat_rows in groupby(rows, key=itemgetter(0))
         ]
-        tree.append({"folder_category": cat_name, "subfolders": subfolders})
-    return tree
 
 
 def get_project_doc_last_checked(project_id: str) -> str | None:
     """Return the most recent last_checked timestamp for a project's docs."""
-    conn = get_db()
-    row = conn.execute(
-        "SELECT MAX(last_checked) as ts FROM lucernex_documents WHERE project_id = ?",
-        (project_id,),
-    ).fetchone()
-    conn.close()
-    return row["ts"] if row else None
+    with db_txn() as conn:
+        row = conn.execute(
+            "SELECT MAX(last_checked) as ts FROM lucernex_documents WHERE project_id = ?",
+            (project_id,),
+        ).fetchone()
+        return row["ts"] if row else None
 
 
 def get_project_doc_count(project_id: str) -> int:
     """Return count of active documents for a project."""
-    conn = get_db()
-    row = conn.execute(
-        "SELECT COUNT(*) as cnt FROM lucernex_documents WHERE project_id = ? AND is_deleted = 0",
-        (project_id,),
-    ).fetchone()
-    conn.close()
-    return row["cnt"] if row else 0
+    with db_txn() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) as cnt FROM lucernex_documents WHERE project_id = ? AND is_deleted = 0",
+            (project_id,),
+        ).fetchone()
+        return row["cnt"] if row else 0
@@ -2,8 +2,12 @@
 
 from __future__ import annotations
 
+import json
 import logging
-from database import get_db
+from functools import lru_cache
+
+from database import db_txn, fetch_dicts
+from querycache import ttl_cache
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +30,15 @@ _PO_SORT_COLUMNS = {
     "sap_project_definition": "po.sap_project_definition",
 }
 
+# Sort keys that can page by keyset: plain columns returned unchanged
+# under the same name, so the last row on a page carries its own cursor.
+# Secondary indexes on WITHOUT ROWID sap_po already end in po_number.
+_PO_KEYSET_SORTS = frozenset({
+    "po_number", "vendor", "store_sequence", "city", "state",
+    "project_status", "po_status", "created_date", "last_update",
+    "sap_project_definition",
+})
+
 # Search fields for the PO tab — mirrors the Projects tab plus PO-specific.
 PO_SEARCH_FIELDS: dict[str, dict] = {
     "po_number":      {"label": "PO Number",   "col": "po.po_number"},
@@ -56,28 +69,27 @@ def _build_po_search_clause(
     terms = [t.strip() for t in search.split(";") if t.strip()]
     if not terms:
         return "", []
-    active = fields if fields else _ALL_PO_FIELD_KEYS
-    clauses: list[str] = []
-    params: list = []
-    for term in terms:
-        like = f"%{term}%"
-        or_parts: list[str] = []
-        for key in active:
-            meta = PO_SEARCH_FIELDS.get(key)
-            if meta:
-                or_parts.append(f"{meta['col']} LIKE ?")
-                params.append(like)
-        if or_parts:
-            clauses.append(f"({' OR '.join(or_parts)})")
-    if not clauses:
+    fragment, n_params = _po_search_term_fragment(
+        tuple(fields or _ALL_PO_FIELD_KEYS),
+    )
+    if not fragment:
         return "", []
-    return f" AND ({' AND '.join(clauses)})", params
+    params = [f"%{term}%" for term in terms for _ in range(n_params)]
+    return f" AND ({' AND '.join([fragment] * len(terms))})", params
+
+
+@lru_cache(maxsize=64)
+def _po_search_term_fragment(active: tuple[str, ...]) -> tuple[str, int]:
+    """Return one term's OR-group over ``active`` PO fields and its ? count."""
+    cols = [PO_SEARCH_FIELDS[k]["col"] for k in active if k in PO_SEARCH_FIELDS]
+    if not cols:
+        return "", 0
+    return f"({' OR '.join(f'{c} LIKE ?' for c in cols)})", len(cols)
 
 
 # ── Core PO base query (shared across list + summary) ────────────────
 
-_PO_BASE_QUERY = """
-    SELECT
+_PO_COLUMNS = """
         po.po_number,
         po.vendor,
         po.vendor_email,
@@ -104,22 +116,24 @@ _PO_BASE_QUERY = """
              THEN COALESCE(po.remaining_to_invoice, 0)
              ELSE 0 END AS give_back_amount,
         -- Aging: days since last update
-        CAST(
-            JULIANDAY('now') - JULIANDAY(
-                COALESCE(po.last_update, po.created_date)
-            ) AS INTEGER
-        ) AS days_since_last_invoice,
+        CAST(JULIANDAY('now') - po.activity_day AS INTEGER)
+            AS days_since_last_invoice,
         po.created_date,
         po.last_update,
         po.sap_project_definition,
         p.general_contractor,
         p.project_type,
         p.brief_scope_of_work
+"""
+
+_PO_FROM = """
     FROM sap_po po
     LEFT JOIN projects p
         ON po.sap_project_definition = p.sap_project_definition
 """
 
+_PO_BASE_QUERY = f"\n    SELECT{_PO_COLUMNS}{_PO_FROM}"
+
 
 def _build_po_filters(
     vendor: str | None = None,
@@ -134,45 +148,76 @@ def _build_po_filters(
     sap_def: str | None = None,
 ) -> tuple[str, list]:
     """Build WHERE clauses from filter params. Returns (sql, params)."""
-    where = " WHERE 1=1"
+    where, params = _po_filters(
+        vendor, state, project_status, po_status, has_remaining,
+        give_back_only, aging_30, search,
+        tuple(search_fields) if search_fields else None, sap_def,
+    )
+    return where, list(params)
+
+
+@lru_cache(maxsize=128)
+def _po_filters(
+    vendor: str | None,
+    state: str | None,
+    project_status: str | None,
+    po_status: str | None,
+    has_remaining: bool,
+    give_back_only: bool,
+    aging_30: bool,
+    search: str | None,
+    search_fields: tuple[str, ...] | None,
+    sap_def: str | None,
+) -> tuple[str, tuple]:
+    """Memoised core of ``_build_po_filters``.
+
+    A page load builds the same filters for the list, the summary panel
+    and its give-back subquery; params come back as a tuple so the cached
+    value cannot be mutated by a caller.
+    """
+    parts = [" WHERE 1=1"]
     params: list = []
 
     if vendor:
-        where += " AND po.vendor = ?"
+        parts.append(" AND po.vendor = ?")
         params.append(vendor)
     if state:
-        where += " AND p.state = ?"
+        parts.append(" AND p.state = ?")
         params.append(state)
     if project_status:
-        where += " AND p.project_status = ?"
+        parts.append(" AND p.project_status = ?")
         params.append(project_status)
     if po_status:
-        where += " AND po.po_status = ?"
+        parts.append(" AND po.po_status = ?")
         params.append(po_status)
     if has_remaining:
-        where += " AND COALESCE(po.remaining_to_invoice, 0) > 0"
+        parts.append(" AND COALESCE(po.remaining_to_invoice, 0) > 0")
     if give_back_only:
-        where += (
+        # The IN list lets SQLite seek complete projects on
+        # idx_projects_status_lower; the joined-status test still decides,
+        # since the join yields one row per project sharing a SAP definition.
+        parts.append(
+            " AND po.sap_project_definition IN ("
+            "SELECT sap_project_definition FROM projects"
+            " WHERE LOWER(project_status) = 'complete')"
             " AND LOWER(p.project_status) = 'complete'"
             " AND COALESCE(po.remaining_to_invoice, 0) > 0"
         )
     if aging_30:
-        where += (
-            " AND CAST(JULIANDAY('now') - JULIANDAY("
-            "COALESCE(po.last_update, po.created_date)) AS INTEGER) >= 30"
-        )
+        # Same as days_since_last_invoice >= 30, but index-assisted.
+        parts.append(" AND po.activity_day <= JULIANDAY('now') - 30")
     if sap_def:
-        where += " AND po.sap_project_definition = ?"
+        parts.append(" AND po.sap_project_definition = ?")
         params.append(sap_def)
 
     search_clause, search_params = _build_po_search_clause(
         search, fields=search_fields,
     )
     if search_clause:
-        where += search_clause
+        parts.append(search_clause)
         params.extend(search_params)
 
-    return where, params
+    return "".join(parts), tuple(params)
 
 
 def get_all_pos(
@@ -190,8 +235,22 @@ def get_all_pos(
     order: str | None = None,
     page: int = 1,
     page_size: int = 100,
-) -> tuple[list[dict], int]:
-    """Return paginated PO list + total count."""
+    after: list | tuple | None = None,
+    count: bool = True,
+) -> tuple[list[dict], int | None]:
+    """Return paginated PO list + total count.
+
+    ``after`` is the previous page's ``po_page_cursor``.  When given for a
+    keyset-capable sort, the page seeks past that row instead of scanning
+    and discarding ``OFFSET`` rows; ``page`` still drives the total.
+    Rows are ordered down to ``p.project_id`` because a PO repeats once per
+    project sharing its SAP definition, and the seek must not skip those.
+
+    With ``count=False`` the total is None and the page query can stop
+    after ``page_size`` rows instead of visiting every match; use it when
+    the count is known elsewhere (``get_po_summary_stats()["total_pos"]``
+    counts the same filtered rows).
+    """
     where, params = _build_po_filters(
         vendor=vendor, state=state, project_status=project_status,
         po_status=po_status, has_remaining=has_remaining,
@@ -199,21 +258,87 @@ def get_all_pos(
         search=search, search_fields=search_fields, sap_def=sap_def,
     )
 
-    conn = get_db()
-
-    # Total count for pagination
-    count_sql = f"SELECT COUNT(*) as cnt FROM sap_po po LEFT JOIN projects p ON po.sap_project_definition = p.sap_project_definition{where}"
-    total = conn.execute(count_sql, params).fetchone()["cnt"]
-
-    # Main query with sort + pagination
+    # Main query with sort + pagination; the window count rides along on
+    # every row so the filter is evaluated once per page load.  The
+    # po_number/project_id tiebreak makes the order total for the seek.
     sort_col = _PO_SORT_COLUMNS.get(sort, "po.po_number")
     sort_dir = "DESC" if order == "desc" else "ASC"
     offset = (page - 1) * page_size
+    page_where, page_params, skip = where, params, offset
+    if after is not None and page > 1 and (sort or "po_number") in _PO_KEYSET_SORTS:
+        seek, seek_params = _keyset_clause(sort_col, sort_dir, *after)
+        page_where += seek
+        page_params = params + seek_params
+        skip = 0
+    window = " COUNT(*) OVER () AS _total," if count else ""
+    query = (
+        f"SELECT{window}{_PO_COLUMNS}{_PO_FROM}{page_where}"
+        f" ORDER BY {sort_col} {sort_dir}, po.po_number {sort_dir},"
+        f" p.project_id {sort_dir} LIMIT ? OFFSET ?"
+    )
 
-    query = f"{_PO_BASE_QUERY}{where} ORDER BY {sort_col} {sort_dir} LIMIT ? OFFSET ?"
-    rows = conn.execute(query, params + [page_size, offset]).fetchall()
-    conn.close()
-    return [dict(r) for r in rows], total
+    with db_txn() as conn:
+        pos = fetch_dicts(conn, query, page_params + [page_size, skip])
+        if not count:
+            return pos, None
+        if pos:
+            # Under a keyset seek the window only sees the rows from here on.
+            total = pos[0]["_total"] + offset - skip
+            for po in pos:
+                del po["_total"]
+        elif offset:
+            # Paged past the end (or a stale cursor): count the filter alone.
+            total = conn.execute(
+                f"SELECT COUNT(*){_PO_FROM}{where}", params,
+            ).fetchone()[0]
+        else:
+            total = 0
+        return pos, total
+
+
+def _keyset_clause(
+    sort_col: str, sort_dir: str, last_value, last_po: str,
+    last_project: str | None,
+) -> tuple[str, list]:
+    """WHERE fragment selecting rows after (last_value, last_po, last_project).
+
+    SQLite sorts NULLs first ascending and last descending; a plain
+    row-value comparison drops them, so a NULL sort value is matched
+    explicitly.  A NULL project_id needs no case of its own: it only
+    occurs on a PO with no linked project, which has no sibling rows, and
+    the comparison against it is never true.
+    """
+    key = f"({sort_col}, po.po_number, p.project_id)"
+    if sort_dir == "ASC":
+        if last_value is None:
+            return (
+                f" AND ({sort_col} IS NOT NULL"
+                f" OR (po.po_number, p.project_id) > (?, ?))",
+                [last_po, last_project],
+            )
+        return f" AND {key} > (?, ?, ?)", [last_value, last_po, last_project]
+    if last_value is None:
+        return (
+            f" AND {sort_col} IS NULL"
+            f" AND (po.po_number, p.project_id) < (?, ?)",
+            [last_po, last_project],
+        )
+    return (
+        f" AND ({key} < (?, ?, ?) OR {sort_col} IS NULL)",
+        [last_value, last_po, last_project],
+    )
+
+
+def po_page_cursor(pos: list[dict], sort: str | None) -> list | None:
+    """Return the ``after`` cursor for the page following ``pos``.
+
+    None when the page is empty or the sort column cannot seek.
+    """
+    key = sort or "po_number"
+    if not pos or key not in _PO_KEYSET_SORTS:
+        return None
+    last = pos[-1]
+    return [last[key], last["po_number"], last["project_id"]]
 
 
 def get_po_summary_stats(
@@ -229,91 +354,133 @@ def get_po_summary_stats(
     sap_def: str | None = None,
 ) -> dict:
     """Summary panel stats scoped to current filters."""
-    where, params = _build_po_filters(
+    filters = dict(
         vendor=vendor, state=state, project_status=project_status,
         po_status=po_status, has_remaining=has_remaining,
-        give_back_only=give_back_only, aging_30=aging_30,
-        search=search, search_fields=search_fields, sap_def=sap_def,
+        aging_30=aging_30, search=search, search_fields=search_fields,
+        sap_def=sap_def,
     )
-    conn = get_db()
-    row = conn.execute(f"""
-        SELECT
-            COUNT(*) AS total_pos,
-            COALESCE(SUM(po.po_total), 0) AS total_po_value,
-            COALESCE(SUM(po.invoiced_to_date), 0) AS total_invoiced,
-            COALESCE(SUM(po.remaining_to_invoice), 0) AS total_remaining,
-            COALESCE(SUM(
-                CASE WHEN LOWER(p.project_status) = 'complete'
-                          AND COALESCE(po.remaining_to_invoice, 0) > 0
-                     THEN po.remaining_to_invoice ELSE 0 END
-            ), 0) AS total_give_back,
-            COUNT(DISTINCT CASE
-                WHEN LOWER(p.project_status) = 'complete'
-                     AND COALESCE(po.remaining_to_invoice, 0) > 0
-                THEN p.project_id END
-            ) AS complete_with_open_pos
-        FROM sap_po po
-        LEFT JOIN projects p
-            ON po.sap_project_definition = p.sap_project_definition
-        {where}
-    """, params).fetchone()
-    conn.close()
-    return dict(row)
+    where, params = _build_po_filters(give_back_only=give_back_only, **filters)
+    # The give-back figures are the same filters plus give_back_only, which
+    # seeks complete projects by index; aggregating that small set avoids
+    # a DISTINCT hash over every scanned PO.
+    gb_where, gb_params = _build_po_filters(give_back_only=True, **filters)
+    with db_txn() as conn:
+        row = conn.execute(f"""
+            SELECT t.total_pos, t.total_po_value, t.total_invoiced,
+                   t.total_remaining, gb.total_give_back,
+                   gb.complete_with_open_pos
+            FROM (
+                SELECT
+                    COUNT(*) AS total_pos,
+                    COALESCE(SUM(po.po_total), 0) AS total_po_value,
+                    COALESCE(SUM(po.invoiced_to_date), 0) AS total_invoiced,
+                    COALESCE(SUM(po.remaining_to_invoice), 0) AS total_remaining
+                {_PO_FROM}{where}
+            ) t, (
+                SELECT
+                    COALESCE(SUM(po.remaining_to_invoice), 0) AS total_give_back,
+                    COUNT(DISTINCT p.project_id) AS complete_with_open_pos
+                {_PO_FROM}{gb_where}
+            ) gb
+        """, params + gb_params).fetchone()
+        return dict(row)
 
 
+@ttl_cache(seconds=300)
 def get_po_filter_options() -> dict:
-    """Return distinct values for filter dropdowns."""
-    conn = get_db()
-    vendors = [
-        r["vendor"] for r in conn.execute(
-            "SELECT DISTINCT vendor FROM sap_po WHERE vendor IS NOT NULL AND vendor != '' ORDER BY vendor"
-        ).fetchall()
-    ]
-    states = [
-        r["state"] for r in conn.execute(
-            "SELECT DISTINCT p.state FROM sap_po po "
+    """Return distinct values for filter dropdowns.
+
+    One UNION ALL statement; ``kind`` says which dropdown a value feeds.
+    """
+    options: dict[str, list] = {
+        "vendors": [],
+        "states": [],
+        "project_statuses": [],
+        "po_statuses": [],
+    }
+    with db_txn() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT 'vendors' AS kind, vendor AS val FROM sap_po "
+            "WHERE vendor IS NOT NULL AND vendor != '' "
+            "UNION ALL "
+            "SELECT DISTINCT 'states', p.state FROM sap_po po "
             "LEFT JOIN projects p ON po.sap_project_definition = p.sap_project_definition "
-            "WHERE p.state IS NOT NULL ORDER BY p.state"
-        ).fetchall()
-    ]
-    project_statuses = [
-        r["project_status"] for r in conn.execute(
-            "SELECT DISTINCT p.project_status FROM sap_po po "
+            "WHERE p.state IS NOT NULL "
+            "UNION ALL "
+            "SELECT DISTINCT 'project_statuses', p.project_status FROM sap_po po "
             "LEFT JOIN projects p ON po.sap_project_definition = p.sap_project_definition "
-            "WHERE p.project_status IS NOT NULL ORDER BY p.project_status"
-        ).fetchall()
-    ]
-    po_statuses = [
-        r["po_status"] for r in conn.execute(
-            "SELECT DISTINCT po_status FROM sap_po WHERE po_status IS NOT NULL ORDER BY po_status"
-        ).fetchall()
-    ]
-    conn.close()
-    return {
-        "vendors": vendors,
-        "states": states,
-        "project_statuses": project_statuses,
-        "po_statuses": po_statuses,
-    }
+            "WHERE p.project_status IS NOT NULL "
+            "UNION ALL "
+            "SELECT DISTINCT 'po_statuses', po_status FROM sap_po "
+            "WHERE po_status IS NOT NULL "
+            "ORDER BY kind, val"
+        )
+        for kind, val in rows:
+            options[kind].append(val)
+    return options
 
 
 def get_po_detail(po_number: str) -> dict | None:
     """Return a single PO with linked project info."""
-    conn = get_db()
-    row = conn.execute(f"{_PO_BASE_QUERY} WHERE po.po_number = ?", (po_number,)).fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with db_txn() as conn:
+        row = conn.execute(f"{_PO_BASE_QUERY} WHERE po.po_number = ?", (po_number,)).fetchone()
+        return dict(row) if row else None
+
+
+# Export sort key: every PO that lands in the "Unknown Vendor" section
+# (NULL, blank, or literally named so) sorts first, keeping each vendor's
+# rows contiguous.
+_EXPORT_VENDOR_ORDER = "COALESCE(NULLIF(po.vendor, 'Unknown Vendor'), '')"
 
 
 def get_pos_for_email_export(po_numbers: list[str]) -> list[dict]:
     """Return PO details grouped by vendor for email export."""
     if not po_numbers:
         return []
-    placeholders = ",".join("?" * len(po_numbers))
-    conn = get_db()
-    rows = conn.execute(
-        f"{_PO_BASE_QUERY} WHERE po.po_number IN ({placeholders}) ORDER BY po.vendor, po.po_number",
-        po_numbers,
-    ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    # One JSON-array parameter instead of a ? per PO: no bound-variable
+    # limit, a single cached statement, and a primary-key seek per PO.
+    with db_txn() as conn:
+        return fetch_dicts(
+            conn,
+            f"{_PO_BASE_QUERY} WHERE po.po_number IN (SELECT value FROM json_each(?))"
+            f" ORDER BY {_EXPORT_VENDOR_ORDER}, po.po_number",
+            (json.dumps(po_numbers),),
+        )
+
+
+def get_po_export_aggregates(po_numbers: list[str]) -> tuple[list[dict], dict]:
+    """Return (per-vendor subtotals, grand totals) for the email export.
+
+    Vendor rows come in the same order as the vendor runs in
+    ``get_pos_for_email_export``, each with its ``po_count``.  SQLite has no ROLLUP,
+    so the grand total is a UNION ALL row over the same selection.
+    """
+    if not po_numbers:
+        return [], {}
+    with db_txn() as conn:
+        rows = fetch_dicts(conn, f"""
+            WITH sel AS (
+                SELECT {_EXPORT_VENDOR_ORDER} AS vendor_order,{_PO_COLUMNS}{_PO_FROM}
+                WHERE po.po_number IN (SELECT value FROM json_each(?))
+            )
+            SELECT 0 AS is_total,
+                   COALESCE(NULLIF(vendor, ''), 'Unknown Vendor') AS vendor,
+                   MIN(vendor_order) AS sort_key,
+                   COUNT(*) AS po_count,
+                   SUM(po_total) AS total,
+                   SUM(invoiced_to_date) AS invoiced,
+                   SUM(remaining_to_invoice) AS remaining,
+                   SUM(give_back_amount) AS give_back
+            FROM sel
+            GROUP BY 2
+            UNION ALL
+            SELECT 1, NULL, NULL, COUNT(*), COALESCE(SUM(po_total), 0),
+                   COALESCE(SUM(invoiced_to_date), 0),
+                   COALESCE(SUM(remaining_to_invoice), 0),
+                   COALESCE(SUM(give_back_amount), 0)
+            FROM sel
+            ORDER BY is_total, sort_key
+        """, (json.dumps(po_numbers),))
+    totals = rows.pop()
+    return rows, totals
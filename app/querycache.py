@@ -0,0 +1,47 @@
+"""In-process TTL cache for the read-mostly dashboard aggregate queries."""
+
+import threading
+import time
+from functools import wraps
+
+from database import data_version
+
+# Per-function entry cap; expired entries go first, then the oldest.
+_MAX_ENTRIES = 512
+
+
+def ttl_cache(seconds: float = 60):
+    """Memoise a query function for ``seconds``, or until the data changes.
+
+    The key includes ``database.data_version()``, so any commit (an ETL
+    refresh, a document sync) misses straight away; the TTL only bounds
+    how long an entry is kept.  Arguments must be hashable.  Cached
+    results are shared between callers and must be treated as read-only.
+    """
+    def decorator(func):
+        cache: dict = {}
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (data_version(), args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with lock:
+                hit = cache.get(key)
+                if hit is not None and hit[0] > now:
+                    return hit[1]
+
+            value = func(*args, **kwargs)
+
+            with lock:
+                if len(cache) >= _MAX_ENTRIES:
+                    for k in [k for k, (exp, _) in cache.items() if exp <= now]:
+                        del cache[k]
+                    if len(cache) >= _MAX_ENTRIES:
+                        del cache[next(iter(cache))]
+                cache[key] = (now + seconds, value)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
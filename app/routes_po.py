@@ -2,11 +2,12 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import math
-from collections import defaultdict
 from datetime import datetime, timezone
+from itertools import groupby
 from pathlib import Path
 
 from fastapi import APIRouter, Query, Request
@@ -18,10 +19,13 @@ from queries_po import (
     PO_SEARCH_FIELDS,
     get_all_pos,
     get_po_detail,
+    get_po_export_aggregates,
     get_po_filter_options,
     get_po_summary_stats,
     get_pos_for_email_export,
+    po_page_cursor,
 )
+from streaming import stream_template
 
 logger = logging.getLogger(__name__)
 
@@ -37,9 +41,30 @@ def fmt_currency(value: float | None) -> str:
 templates.env.filters["currency"] = fmt_currency
 
 
+_TRUTHY = frozenset(("1", "true", "on", "yes"))
+
+
 def _bool_param(val: str | None) -> bool:
     """Parse toggle filter params to bool."""
-    return val in ("1", "true", "on", "yes")
+    return val in _TRUTHY
+
+
+def _parse_cursor(raw: str | None) -> list | None:
+    """Decode the JSON ``after`` cursor posted by the Next button."""
+    if not raw:
+        return None
+    try:
+        cursor = json.loads(raw)
+    except ValueError:
+        return None
+    if (
+        isinstance(cursor, list) and len(cursor) == 3
+        and (cursor[0] is None or isinstance(cursor[0], (str, int, float)))
+        and isinstance(cursor[1], str)
+        and (cursor[2] is None or isinstance(cursor[2], str))
+    ):
+        return cursor
+    return None
 
 
 def _common_filter_params(
@@ -68,7 +93,7 @@ def _common_filter_params(
 
 
 @router.get("/pos", response_class=HTMLResponse)
-def pos_list(
+async def pos_list(
     request: Request,
     vendor: str = Query(None),
     state: str = Query(None),
@@ -82,6 +107,7 @@ def pos_list(
     sort: str = Query(None),
     order: str = Query(None),
     page: int = Query(1, ge=1),
+    after: str = Query(None),
 ):
     """Main POs tab view."""
     filters = _common_filter_params(
@@ -91,11 +117,19 @@ def pos_list(
         search=search, sap_def=sap_def,
     )
 
-    pos, total = get_all_pos(
-        **filters, sort=sort, order=order, page=page,
+    # Independent reads: run them side by side on pooled readers.
+    # The summary counts the same filtered rows, so the page query skips
+    # its own COUNT and can stop at the page boundary.
+    (pos, _), summary, filter_opts, refresh_meta = await asyncio.gather(
+        asyncio.to_thread(
+            get_all_pos, **filters, sort=sort, order=order, page=page,
+            after=_parse_cursor(after), count=False,
+        ),
+        asyncio.to_thread(get_po_summary_stats, **filters),
+        asyncio.to_thread(get_po_filter_options),
+        asyncio.to_thread(get_refresh_metadata),
     )
-    summary = get_po_summary_stats(**filters)
-    filter_opts = get_po_filter_options()
+    total = summary["total_pos"]
     total_pages = max(1, math.ceil(total / 100))
 
     return templates.TemplateResponse("pos.html", {
@@ -105,6 +139,7 @@ def pos_list(
         "total": total,
         "page": page,
         "total_pages": total_pages,
+        "next_cursor": po_page_cursor(pos, sort),
         "filter_opts": filter_opts,
         "search": search or "",
         "sort": sort or "po_number",
@@ -114,17 +149,18 @@ def pos_list(
         "selected_state": state or "",
         "selected_project_status": project_status or "",
         "selected_po_status": po_status or "",
-        "has_remaining": _bool_param(has_remaining),
-        "give_back_only": _bool_param(give_back_only),
-        "aging_30": _bool_param(aging_30),
+        # Already parsed once into the filters.
+        "has_remaining": filters["has_remaining"],
+        "give_back_only": filters["give_back_only"],
+        "aging_30": filters["aging_30"],
         "selected_sap_def": sap_def or "",
         "search_fields_meta": PO_SEARCH_FIELDS,
-        "refresh_meta": get_refresh_metadata(),
+        "refresh_meta": refresh_meta,
     })
 
 
 @router.get("/pos/table", response_class=HTMLResponse)
-def pos_table_partial(
+async def pos_table_partial(
     request: Request,
     vendor: str = Query(None),
     state: str = Query(None),
@@ -138,6 +174,7 @@ def pos_table_partial(
     sort: str = Query(None),
     order: str = Query(None),
     page: int = Query(1, ge=1),
+    after: str = Query(None),
 ):
     """HTMX partial: PO table body + pagination."""
     filters = _common_filter_params(
@@ -146,19 +183,25 @@ def pos_table_partial(
         give_back_only=give_back_only, aging_30=aging_30,
         search=search, sap_def=sap_def,
     )
-    pos, total = get_all_pos(
-        **filters, sort=sort, order=order, page=page,
+    (pos, _), summary = await asyncio.gather(
+        asyncio.to_thread(
+            get_all_pos, **filters, sort=sort, order=order, page=page,
+            after=_parse_cursor(after), count=False,
+        ),
+        asyncio.to_thread(get_po_summary_stats, **filters),
     )
-    summary = get_po_summary_stats(**filters)
+    total = summary["total_pos"]
     total_pages = max(1, math.ceil(total / 100))
 
-    return templates.TemplateResponse("partials/pos_table.html", {
+    # Streamed: the summary and header rows ship while the rest render.
+    return stream_template(templates, "partials/pos_table.html", {
         "request": request,
         "pos": pos,
         "summary": summary,
         "total": total,
         "page": page,
         "total_pages": total_pages,
+        "next_cursor": po_page_cursor(pos, sort),
         "sort": sort or "po_number",
         "order": order or "asc",
     })
@@ -194,43 +237,35 @@ async def po_export_email(request: Request):
             '<p class="text-walmart-red-100 p-4">No PO data found.</p>'
         )
 
-    # Compute aggregate metrics across all selected POs.
-    total_po_value = sum(p.get("po_total", 0) for p in pos)
-    total_invoiced = sum(p.get("invoiced_to_date", 0) for p in pos)
-    total_remaining = sum(p.get("remaining_to_invoice", 0) for p in pos)
-    total_give_back = sum(p.get("give_back_amount", 0) for p in pos)
-    pct_invoiced = (total_invoiced / total_po_value * 100) if total_po_value else 0
-    pct_remaining = (total_remaining / total_po_value * 100) if total_po_value else 0
-
-    # Group by vendor
-    by_vendor: dict[str, list[dict]] = defaultdict(list)
-    for po in pos:
-        by_vendor[po.get("vendor") or "Unknown Vendor"].append(po)
+    # Sums come from SQL; Python only walks each vendor's run of rows
+    # (pos is ordered by vendor, matching the subtotal rows) and formats.
+    vendor_totals, totals = get_po_export_aggregates(po_numbers)
+    total_po_value = totals["total"]
+    pct_invoiced = (totals["invoiced"] / total_po_value * 100) if total_po_value else 0
+    pct_remaining = (totals["remaining"] / total_po_value * 100) if total_po_value else 0
 
-    # Build vendor sections with per-vendor metrics
     vendor_sections: list[dict] = []
-    for vendor_name, vendor_pos in by_vendor.items():
-        v_total = sum(p.get("po_total", 0) for p in vendor_pos)
-        v_invoiced = sum(p.get("invoiced_to_date", 0) for p in vendor_pos)
-        v_remaining = sum(p.get("remaining_to_invoice", 0) for p in vendor_pos)
-        v_give_back = sum(p.get("give_back_amount", 0) for p in vendor_pos)
-        v_pct = (v_invoiced / v_total * 100) if v_total else 0
+    vendor_runs = groupby(pos, key=lambda p: p["vendor"] or "Unknown Vendor")
+    for v, (_, run) in zip(vendor_totals, vendor_runs):
+        vendor_pos = list(run)
+        v_total = v["total"]
+        v_pct = (v["invoiced"] / v_total * 100) if v_total else 0
 
         if len(vendor_pos) == 1:
             subject = f"PO Status Update \u2013 {vendor_pos[0]['po_number']}"
         else:
-            subject = f"PO Status Update \u2013 {vendor_name}"
+            subject = f"PO Status Update \u2013 {v['vendor']}"
 
         vendor_sections.append({
-            "vendor": vendor_name,
+            "vendor": v["vendor"],
             "vendor_email": vendor_pos[0].get("vendor_email") or "",
             "subject": subject,
             "pos": vendor_pos,
-            "po_count": len(vendor_pos),
+            "po_count": v["po_count"],
             "total": v_total,
-            "invoiced": v_invoiced,
-            "remaining": v_remaining,
-            "give_back": v_give_back,
+            "invoiced": v["invoiced"],
+            "remaining": v["remaining"],
+            "give_back": v["give_back"],
             "pct_invoiced": v_pct,
         })
 
@@ -241,11 +276,11 @@ async def po_export_email(request: Request):
         "now_utc": now_utc,
         "vendor_sections": vendor_sections,
         "metrics": {
-            "po_count": len(pos),
+            "po_count": totals["po_count"],
             "total_value": total_po_value,
-            "invoiced": total_invoiced,
-            "remaining": total_remaining,
-            "give_back": total_give_back,
+            "invoiced": totals["invoiced"],
+            "remaining": totals["remaining"],
+            "give_back": totals["give_back"],
             "pct_invoiced": pct_invoiced,
             "pct_remaining": pct_remaining,
         },
@@ -4,6 +4,7 @@ import random
 from datetime import datetime, timedelta
 
 from database import get_db, init_db
+from queries import refresh_dashboard_snapshots
 
 PROJECT_TYPES = [
     "PLBG Equipment Replacement",
@@ -78,8 +79,12 @@ def seed_data(num_projects: int = 30) -> None:
     conn.execute("DELETE FROM sap_po")
     conn.execute("DELETE FROM sap_budget")
     conn.execute("DELETE FROM projects")
+    conn.execute("DELETE FROM dashboard_snapshots")
 
     base_date = datetime(2026, 2, 10)
+    project_rows: list[tuple] = []
+    budget_rows: list[tuple] = []
+    po_rows: list[tuple] = []
 
     for i in range(1, num_projects + 1):
         project_id = f"LXN-{i:06d}"
@@ -93,8 +98,7 @@ def seed_data(num_projects: int = 30) -> None:
         gc = random.choice(CONTRACTORS)
         updated = (base_date - timedelta(days=random.randint(0, 30))).isoformat()
 
-        conn.execute(
-            """INSERT INTO projects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        project_rows.append(
             (project_id, project_type, store, seq, f"{store}-{seq}",
              city, state, status, sap_def, scope, gc, updated),
         )
@@ -105,8 +109,7 @@ def seed_data(num_projects: int = 30) -> None:
         budget_committed = round(budget_total * random.uniform(0.2, 0.5), 2)
         budget_open = round(budget_total - budget_actuals - budget_committed, 2)
 
-        conn.execute(
-            """INSERT OR IGNORE INTO sap_budget VALUES (?, ?, ?, ?, ?, ?)""",
+        budget_rows.append(
             (sap_def, budget_total, budget_open, budget_committed,
              budget_actuals, updated),
         )
@@ -121,14 +124,37 @@ def seed_data(num_projects: int = 30) -> None:
             po_status = random.choice(["Open", "Open", "Closed", "Partially Invoiced"])
             created = (base_date - timedelta(days=random.randint(10, 90))).strftime("%Y-%m-%d")
 
-            conn.execute(
-                """INSERT OR IGNORE INTO sap_po VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            po_rows.append(
                 (po_num, sap_def, vendor, po_total, invoiced,
                  remaining, po_status, created, updated),
             )
 
-    conn.commit()
-    conn.close()
+    # One prepared statement and one transaction per table load.
+    with conn:
+        conn.executemany(
+            """INSERT INTO projects
+               (project_id, project_type, store, sequence, store_sequence,
+                city, state, project_status, sap_project_definition,
+                brief_scope_of_work, general_contractor, lucernex_updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            project_rows,
+        )
+        conn.executemany(
+            """INSERT OR IGNORE INTO sap_budget
+               (sap_project_definition, budget_total, budget_open,
+                budget_committed, budget_actuals, sap_updated_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            budget_rows,
+        )
+        conn.executemany(
+            """INSERT OR IGNORE INTO sap_po
+               (po_number, sap_project_definition, vendor, po_total,
+                invoiced_to_date, remaining_to_invoice, po_status,
+                created_date, last_update)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            po_rows,
+        )
+    refresh_dashboard_snapshots()
     print(f"Seeded {num_projects} projects with budgets and POs.")
 
 
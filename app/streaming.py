@@ -0,0 +1,33 @@
+"""Incremental template rendering for the HTMX table partials."""
+
+from typing import Iterator
+
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+
+# Bytes gathered from the template stream before each socket write.
+_STREAM_CHUNK = 16 * 1024
+
+
+def stream_template(
+    templates: Jinja2Templates, name: str, context: dict,
+) -> StreamingResponse:
+    """Render ``name`` incrementally instead of into one string first.
+
+    Jinja yields small fragments; they are batched into ~16 KiB writes so
+    the first rows reach the browser while later ones are still rendering.
+    """
+    def body() -> Iterator[str]:
+        buf: list[str] = []
+        size = 0
+        for fragment in templates.get_template(name).generate(context):
+            buf.append(fragment)
+            size += len(fragment)
+            if size >= _STREAM_CHUNK:
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+        if buf:
+            yield "".join(buf)
+
+    return StreamingResponse(body(), media_type="text/html")
@@ -41,5 +41,4 @@ conn.commit()
 cnt = conn.execute('SELECT COUNT(*) FROM lucernex_documents').fetchone()[0]
 print(f"Documents in DB: {cnt}")
 
-conn.close()
 print("Done!")